@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark model loading: pickle artifacts vs. fast artifacts (memory-mapped
+joblib for sklearn, native UBJSON for XGBoost).
+
+For each format, N worker processes (like N uvicorn workers) load every model
+at the same time and report their load time and memory. Private memory is
+RssAnon; Pss splits shared pages between the processes mapping them, so
+memory-mapped arrays show up as a lower Pss per worker.
+
+Usage: python benchmark_artifacts.py [--workers 4] [--repeat 3]
+(run python model_artifacts.py first if training has not written fast artifacts)
+"""
+
+import argparse
+import multiprocessing
+import pickle
+import statistics
+import time
+from pathlib import Path
+
+MODELS_DIR = Path("models")
+
+
+def _memory_kb():
+    """RssAnon, RssFile and Pss of the current process in kB (Linux only)"""
+    stats = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                stats[key] = int(value.split()[0])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    stats["Pss"] = int(line.split()[1])
+    except FileNotFoundError:
+        stats["Pss"] = None
+    return stats
+
+
+def _load_all(artifact_format):
+    from model_artifacts import find_fast_artifact, load_fast_artifact
+    from model_registry import SUPPORT_ARTIFACTS
+
+    models = {}
+    for pkl_path in sorted(MODELS_DIR.glob("*.pkl")):
+        name = pkl_path.stem
+        if name in SUPPORT_ARTIFACTS:
+            continue
+        fast_path = find_fast_artifact(MODELS_DIR, name) if artifact_format == "fast" else None
+        if fast_path is not None:
+            models[name] = load_fast_artifact(fast_path)
+        else:
+            with open(pkl_path, "rb") as f:
+                models[name] = pickle.load(f)
+    return models
+
+
+def _worker(artifact_format, ready, release, results):
+    import warnings
+    # Old-pickle notices from XGBoost would drown the report
+    warnings.filterwarnings("ignore", category=UserWarning)
+    # Libraries are imported before timing, as they are in a running server
+    import sklearn.ensemble  # noqa: F401
+    import xgboost  # noqa: F401
+
+    before = _memory_kb()
+    started = time.perf_counter()
+    models = _load_all(artifact_format)
+    seconds = time.perf_counter() - started
+    # Touch every model once so lazily mapped pages are resident
+    for model in models.values():
+        getattr(model, "n_features_in_", None)
+
+    ready.wait()  # Every worker has loaded before anyone measures shared pages
+    after = _memory_kb()
+    results.put({
+        "seconds": seconds,
+        "anon_kb": after["RssAnon"] - before["RssAnon"],
+        "file_kb": after["RssFile"] - before["RssFile"],
+        "pss_kb": after["Pss"],
+    })
+    release.wait()
+
+
+def run(artifact_format, workers):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(workers)
+    release = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(artifact_format, ready, release, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    release.set()
+    for process in processes:
+        process.join()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'format':<8} {'load ms (median)':>17} {'anon kB/worker':>15} {'file kB/worker':>15} {'Pss kB/worker':>14}")
+    for artifact_format in ("pickle", "fast"):
+        reports = [report for _ in range(args.repeat) for report in run(artifact_format, args.workers)]
+        pss = [report["pss_kb"] for report in reports if report["pss_kb"] is not None]
+        print(
+            f"{artifact_format:<8} "
+            f"{statistics.median(report['seconds'] for report in reports) * 1000:>17.1f} "
+            f"{statistics.median(report['anon_kb'] for report in reports):>15.0f} "
+            f"{statistics.median(report['file_kb'] for report in reports):>15.0f} "
+            f"{(statistics.median(pss) if pss else float('nan')):>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
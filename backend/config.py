@@ -8,6 +8,57 @@ class Settings(BaseSettings):
     serper_api_key: Optional[str] = Field(None, env="SERPER_API_KEY")
     cors_origins: list[str] = ["http://localhost:5173", "http://localhost:5174"]  # Add both ports
     model_path: str = "./models/"
+    warm_up_models: bool = True  # Load and exercise every model before reporting ready
+    warm_up_retry_interval: float = 15.0  # Seconds between warm-up attempts while a worker is not ready
+    model_cache_max_mb: Optional[float] = 1024.0  # Memory budget for loaded models per worker; None is unbounded
+    model_reload_interval: float = 10.0  # Seconds between checks of models/ for new artifacts; 0 disables
+    metrics_dir: Optional[str] = None  # Where serve.py workers share metric snapshots; a temporary directory when unset
+    metrics_flush_interval: float = 1.0  # Seconds between a worker's metric snapshots
+    admin_token: Optional[str] = None  # Required as X-Admin-Token on /api/admin endpoints, which are disabled while unset
+    inference_mode: str = "thread"  # "thread" or "process" pool for predict_proba calls
+    inference_workers: int = 4
+    inference_max_queue: int = 64  # Calls allowed to wait for a worker before returning 503
+    inference_timeout: float = 10.0  # Seconds before a risk calculation returns 504
+    serve_workers: Optional[int] = None  # serve.py worker processes; None is one per available CPU (affinity, capped by the cgroup quota)
+    serve_max_requests: int = 0  # Requests before serve.py recycles a worker; 0 never recycles
+    serve_max_requests_jitter: int = 0  # Random extra requests per worker so they recycle at different times
+    serve_graceful_timeout: float = 30.0  # Seconds a stopping worker gets to finish in-flight requests
+    risk_batching_enabled: bool = False  # Opt-in micro-batching of concurrent risk requests
+    risk_batch_max_size: int = 32
+    risk_batch_max_wait_ms: float = 2.0
+    risk_cache_enabled: bool = True  # LRU cache of risk scores keyed on the step-quantized inputs
+    risk_cache_size: int = 10000
+    risk_cache_ttl: Optional[float] = 3600.0  # Seconds; None keeps entries until evicted
+    counterfactual_budget: int = 50000  # Default number of candidates scored per search
+    counterfactual_max_budget: int = 500000
+    tree_engine_enabled: bool = True  # Serve tree models through the verified flattened evaluator (faster, but its node arrays add to each model's memory)
+    tree_engine_max_rows: int = 256  # Larger batches use the model's own predict_proba
+    csv_chunk_size: int = 5000  # Rows scored per predict_proba call in /api/analyze-csv
+    serper_base_url: str = "https://google.serper.dev"  # Point at a local stub in tests
+    openai_base_url: Optional[str] = None  # None uses the OpenAI default
+    openai_model: str = "gpt-3.5-turbo"
+    upstream_connect_timeout: float = 5.0
+    upstream_read_timeout: float = 30.0
+    upstream_max_retries: int = 2  # Retries on connection errors, 429 and 5xx
+    upstream_max_connections: int = 100
+    upstream_max_keepalive: int = 20
+    sentiment_cache_enabled: bool = True
+    sentiment_cache_size: int = 1000
+    sentiment_cache_ttl: float = 900.0  # Seconds a company's analysis is served without recomputing
+    sentiment_batch_max_companies: int = 500
+    sentiment_batch_concurrency: int = 10  # Companies analyzed at once per batch request
+    sentiment_batch_rate_per_second: Optional[float] = 5.0  # Fresh (uncached) batch analyses per second, shared by all batches; None is unlimited
+    sentiment_cache_stale_ttl: float = 0.0  # >0 serves expired entries this long while refreshing
+    sentiment_search_queries: list[str] = ["news sentiment", "funding", "layoffs"]  # Searched in parallel per company
+    sentiment_search_results: int = 10  # Results requested per query
+    sentiment_context_token_budget: int = 600  # Max tokens of search context in the prompt
+    sentiment_context_similarity: float = 0.8  # Jaccard similarity above which snippets are duplicates
+    sentiment_context_max_sources: int = 12
+    sentiment_history_enabled: bool = True
+    sentiment_history_path: str = "./data/sentiment_history.db"  # SQLite file, created on startup
+    sentiment_history_batch_size: int = 100  # Rows per write transaction
+    sentiment_history_flush_interval: float = 0.5  # Seconds the writer waits to fill a batch
+    sentiment_history_max_queue: int = 10000  # Pending rows before new results are dropped
     
     class Config:
         env_file = ".env"
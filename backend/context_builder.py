@@ -0,0 +1,111 @@
+"""
+Token-budgeted context assembly for sentiment prompts.
+
+Search results from several queries are merged, near-duplicate snippets are
+dropped (word-shingle Jaccard similarity), the rest are ranked by relevance to
+the company and packed into the prompt until the token budget is spent.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # Optional: fall back to the ~4 characters per token rule of thumb
+    _ENCODING = None
+
+_WORD = re.compile(r"\w+")
+
+# Legal suffixes say nothing about whether a snippet is about the company
+_GENERIC_TERMS = {"inc", "corp", "corporation", "co", "ltd", "llc", "plc", "gmbh", "sa", "ag", "the", "company"}
+
+
+def estimate_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Chat prompt size, counting a few tokens of framing per message"""
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+
+def _shingles(text: str, size: int = 3) -> frozenset:
+    words = _words(text)
+    if len(words) < size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two shingle sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def format_source(result: Dict[str, Any]) -> str:
+    return f"{result['title']}: {result['snippet']}"
+
+
+class ContextBuilder:
+    """Dedupes, ranks and budget-truncates search results for one prompt"""
+
+    def __init__(self, token_budget: int = 600, similarity_threshold: float = 0.8, max_sources: int = 12):
+        self.token_budget = token_budget
+        self.similarity_threshold = similarity_threshold
+        self.max_sources = max_sources
+
+    def relevance(self, result: Dict[str, Any], company_terms: set) -> float:
+        """Company mentions (titles count double) plus a bonus for a high search position"""
+        title_terms = set(_words(result.get("title", "")))
+        snippet_terms = set(_words(result.get("snippet", "")))
+        mentions = 0.0
+        if company_terms:
+            mentions = (2 * len(company_terms & title_terms) + len(company_terms & snippet_terms)) / len(company_terms)
+        return mentions + 1.0 / (1 + result.get("position", 0))
+
+    def deduplicate(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the first of every group of near-identical results (input order wins)"""
+        kept, kept_shingles = [], []
+        for result in results:
+            shingles = _shingles(format_source(result))
+            if any(similarity(shingles, other) >= self.similarity_threshold for other in kept_shingles):
+                continue
+            kept.append(result)
+            kept_shingles.append(shingles)
+        return kept
+
+    def build(self, company_name: str, results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, str]], Dict[str, int]]:
+        """Return (prompt content, sources used, size stats)"""
+        company_terms = set(_words(company_name)) - _GENERIC_TERMS or set(_words(company_name))
+        results = [r for r in results if r.get("title") or r.get("snippet")]
+        ranked = sorted(results, key=lambda r: self.relevance(r, company_terms), reverse=True)
+        unique = self.deduplicate(ranked)
+
+        lines, sources, used = [], [], 0
+        for result in unique:
+            if len(sources) >= self.max_sources:
+                break
+            line = format_source(result)
+            tokens = estimate_tokens(line) + 1  # Newline separator
+            if used + tokens > self.token_budget:
+                continue
+            lines.append(line)
+            sources.append({"title": result.get("title", ""), "snippet": result.get("snippet", "")})
+            used += tokens
+
+        stats = {
+            "results": len(results),
+            "duplicates": len(results) - len(unique),
+            "selected": len(sources),
+            "raw_tokens": sum(estimate_tokens(format_source(r)) + 1 for r in results),
+            "context_tokens": used,
+        }
+        return "\n".join(lines), sources, stats
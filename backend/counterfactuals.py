@@ -0,0 +1,158 @@
+"""
+Counterfactual search over the risk calculator's slider space.
+
+Starting from a feature vector, a beam search adds one slider/switch change at
+a time and scores every candidate of a level in large vectorized predict_proba
+batches, collecting the cheapest change sets whose risk falls below a target.
+Cost is the sum of each change's distance as a fraction of its slider range.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SliderSpace:
+    """Integer grid coordinates for every feature definition"""
+
+    def __init__(self, definitions: List[Dict[str, Any]]):
+        self.names = [feature["name"] for feature in definitions]
+        self.steps = np.array([feature.get("step") or 1 for feature in definitions], dtype=np.float64)
+        lows, highs = [], []
+        for feature, step in zip(definitions, self.steps):
+            if feature["type"] == "switch":
+                lows.append(0)
+                highs.append(1)
+            else:
+                lows.append(int(round(feature["min_value"] / step)))
+                highs.append(int(round(feature["max_value"] / step)))
+        self.lows = np.array(lows, dtype=np.int64)
+        self.highs = np.array(highs, dtype=np.int64)
+        self.spans = np.maximum(self.highs - self.lows, 1).astype(np.float64)
+
+    def raw_values(self, values: Dict[str, Any], defaults: Dict[str, Any]) -> np.ndarray:
+        """The input as sent, defaults filling what is missing"""
+        raw = np.empty(len(self.names), dtype=np.float64)
+        for i, name in enumerate(self.names):
+            value = values.get(name)
+            raw[i] = float(defaults[name] if value is None else value)
+        return raw
+
+    def to_grid(self, raw: np.ndarray) -> np.ndarray:
+        """Nearest grid point inside the slider ranges"""
+        return np.clip(np.round(raw / self.steps).astype(np.int64), self.lows, self.highs)
+
+    def to_values(self, grid: np.ndarray) -> np.ndarray:
+        return grid * self.steps
+
+    def neighbours(self, grid: np.ndarray, frozen: np.ndarray) -> np.ndarray:
+        """Every vector that differs from grid in exactly one unfrozen feature"""
+        candidates = []
+        for i in np.flatnonzero(~frozen):
+            positions = np.arange(self.lows[i], self.highs[i] + 1)
+            positions = positions[positions != grid[i]]
+            block = np.repeat(grid[None, :], len(positions), axis=0)
+            block[:, i] = positions
+            candidates.append(block)
+        if not candidates:
+            return np.empty((0, len(grid)), dtype=np.int64)
+        return np.concatenate(candidates)
+
+
+def search_counterfactuals(plan, definitions: List[Dict[str, Any]], defaults: Dict[str, Any],
+                           feature_values: Dict[str, Any], target_risk: float = 0.3,
+                           max_changes: int = 3, budget: int = 50000, max_results: int = 5,
+                           beam_width: int = 16, batch_size: int = 8192) -> Dict[str, Any]:
+    """Find the smallest slider changes that push the model's risk below target_risk.
+
+    The search runs on the slider grid, but features a candidate leaves alone
+    keep the value that was sent, even if it is off the grid or out of range.
+    """
+    space = SliderSpace(definitions)
+    columns = np.array([plan.index[name] for name in space.names], dtype=np.int64)
+    model = plan.predictor
+    original = space.raw_values(feature_values, defaults)
+    base = space.to_grid(original)
+
+    def score(grids: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(grids), dtype=np.float64)
+        for start in range(0, len(grids), batch_size):
+            block = grids[start:start + batch_size]
+            raw = np.repeat(plan.defaults[None, :], len(block), axis=0)
+            raw[:, columns] = np.where(block == base, original, space.to_values(block))
+            probabilities = model.predict_proba(plan.scale(raw).astype(np.float32))
+            scores[start:start + len(block)] = probabilities[:, 1] if probabilities.shape[1] > 1 else probabilities[:, 0]
+        return scores
+
+    base_score = float(score(base[None, :])[0])
+    evaluated = 1
+
+    solutions = {}
+    beam = [base]
+    if base_score < target_risk:
+        beam = []
+
+    for depth in range(1, max_changes + 1):
+        if not beam or evaluated >= budget:
+            break
+
+        candidates = np.concatenate([space.neighbours(state, state != base) for state in beam])
+        candidates = np.unique(candidates, axis=0)
+        remaining = budget - evaluated
+        if len(candidates) > remaining:
+            # Spend what is left on the candidates closest to the starting point
+            costs = (np.abs(candidates - base) / space.spans).sum(axis=1)
+            candidates = candidates[np.argsort(costs, kind="stable")[:remaining]]
+        if len(candidates) == 0:
+            break
+
+        scores = score(candidates)
+        evaluated += len(candidates)
+
+        hits = scores < target_risk
+        costs = (np.abs(candidates - base) / space.spans).sum(axis=1)
+        for grid, risk, cost in zip(candidates[hits], scores[hits], costs[hits]):
+            solutions[grid.tobytes()] = (float(cost), float(risk), grid)
+
+        # Expand the lowest-risk states that have not reached the target yet
+        open_states = np.flatnonzero(~hits)
+        order = open_states[np.argsort(scores[open_states], kind="stable")[:beam_width]]
+        beam = [candidates[i] for i in order]
+        logger.debug(f"🔎 Depth {depth}: scored {len(candidates)} candidates, {int(hits.sum())} below target")
+
+    ranked = sorted(solutions.values(), key=lambda item: (int((item[2] != base).sum()), item[0], item[1]))
+    counterfactuals = []
+    kept_deltas = []
+    seen = set()
+    for cost, risk, grid in ranked:
+        if len(counterfactuals) >= max_results:
+            break
+        delta = grid - base
+        # One result per set of changed features and directions: the cheapest, ranked first
+        signature = tuple(np.sign(delta))
+        if signature in seen:
+            continue
+        # Skip anything a kept result beats with the same moves, each no larger
+        if any(np.all((kept * delta >= 0) & (np.abs(kept) <= np.abs(delta))) for kept in kept_deltas):
+            continue
+        seen.add(signature)
+        kept_deltas.append(delta)
+
+        changes = [
+            {
+                "name": space.names[i],
+                "from_value": round(float(original[i]), 6),
+                "to_value": round(float(grid[i] * space.steps[i]), 6),
+            }
+            for i in np.flatnonzero(delta)
+        ]
+        counterfactuals.append({"changes": changes, "risk_score": risk, "distance": cost})
+
+    return {
+        "base_risk_score": base_score,
+        "counterfactuals": counterfactuals,
+        "evaluated": evaluated,
+    }
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Typed columnar cache for riskDBv4_1.csv.
+
+The CSV is parsed once: "—" placeholders become missing values, funding
+amounts such as "CA$4,500,000" are split into a number and an ISO currency
+code, the mixed "m/d/YYYY H:MM" / "YYYY" dates become datetimes and the
+stringified Founders_Cleaned lists become real lists. The typed frame is
+written to data/columnar/ under the source file's sha256, as Parquet when
+pyarrow is installed and as a pandas pickle otherwise. Later loads skip CSV
+parsing entirely, and Parquet loads read only the requested columns.
+
+Run this module directly to build the cache ahead of training.
+"""
+
+import ast
+import json
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from model_registry import file_sha256
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:  # Optional: fall back to pickles, which cannot be read column-selectively
+    HAS_PYARROW = False
+
+DEFAULT_CACHE_DIR = Path("data/columnar")
+# Bump when the normalization below changes so existing caches are rebuilt
+SCHEMA_VERSION = 1
+
+MISSING = "—"
+DATE_COLUMNS = ["Founded Date", "Announced Date", "Close Date"]
+FUNDING_COLUMN = "Total Funding Amount"
+CURRENCY_COLUMN = "Total Funding Currency"
+NUMERIC_COLUMNS = ["Page Views / Visit"]
+LIST_COLUMNS = ["Founders_Cleaned"]
+CATEGORY_COLUMNS = ["Headquarters Regions"]
+
+# Crunchbase currency prefixes; unprefixed amounts are USD
+CURRENCY_CODES = {
+    "": "USD", "$": "USD", "A$": "AUD", "CA$": "CAD", "CHF": "CHF", "CN¥": "CNY", "HK$": "HKD",
+    "IDR": "IDR", "IRR": "IRR", "MYR": "MYR", "NOK": "NOK", "PLN": "PLN", "R$": "BRL",
+    "RUB": "RUB", "SEK": "SEK", "SGD": "SGD", "TRY": "TRY", "ZAR": "ZAR", "£": "GBP",
+    "¥": "JPY", "€": "EUR", "₩": "KRW", "₪": "ILS", "₱": "PHP", "₹": "INR",
+}
+_AMOUNT = re.compile(r"^\s*(?P<prefix>[^\d\s.,-]*)\s*(?P<number>-?[\d,]*\.?\d+)\s*$")
+
+
+def parse_amounts(values: pd.Series) -> pd.DataFrame:
+    """Split "CA$4,500,000"-style strings into (amount, ISO currency)"""
+    parts = values.astype("string").str.extract(_AMOUNT)
+    amounts = pd.to_numeric(parts["number"].str.replace(",", "", regex=False), errors="coerce")
+    currencies = parts["prefix"].map(CURRENCY_CODES)
+    unknown = parts["prefix"].notna() & currencies.isna()
+    if unknown.any():
+        logger.warning(f"⚠️ Unknown currency prefixes: {sorted(parts['prefix'][unknown].unique())}")
+        currencies = currencies.where(~unknown, parts["prefix"])
+    currencies = currencies.where(amounts.notna())
+    return pd.DataFrame({"amount": amounts.astype("float64"), "currency": currencies.astype("category")})
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Datetimes from "m/d/YYYY H:MM" or bare "YYYY" (January 1st); anything else is NaT"""
+    text = values.astype("string").str.strip()
+    full = pd.to_datetime(text, format="%m/%d/%Y %H:%M", errors="coerce")
+    year_only = pd.to_datetime(text.where(text.str.fullmatch(r"\d{4}", na=False)), format="%Y", errors="coerce")
+    return full.fillna(year_only)
+
+
+def parse_list(value) -> Optional[List[str]]:
+    if not isinstance(value, str) or not value.startswith("["):
+        return None
+    try:
+        return [str(item) for item in ast.literal_eval(value)]
+    except (ValueError, SyntaxError):
+        return None
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Typed copy of the raw CSV frame"""
+    df = df.replace(MISSING, np.nan)
+
+    if FUNDING_COLUMN in df:
+        funding = parse_amounts(df[FUNDING_COLUMN])
+        position = df.columns.get_loc(FUNDING_COLUMN)
+        df[FUNDING_COLUMN] = funding["amount"]
+        df.insert(position + 1, CURRENCY_COLUMN, funding["currency"])
+    for column in DATE_COLUMNS:
+        if column in df:
+            df[column] = parse_dates(df[column])
+    for column in NUMERIC_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in LIST_COLUMNS:
+        if column in df:
+            df[column] = df[column].map(parse_list)
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    return df
+
+
+class DatasetCache:
+    """Columnar copies of a CSV, keyed by the CSV's content hash"""
+
+    def __init__(self, csv_path, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.csv_path = Path(csv_path)
+        self.cache_dir = Path(cache_dir)
+        self.format = "parquet" if HAS_PYARROW else "pkl"
+
+    def _source_hash(self) -> str:
+        """sha256 of the CSV, re-hashed only when its size or mtime changes"""
+        stat = self.csv_path.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        sidecar = self.cache_dir / f"{self.csv_path.stem}.source.json"
+        if sidecar.exists():
+            with open(sidecar) as f:
+                recorded = json.load(f)
+            if recorded.get("stamp") == stamp:
+                return recorded["sha256"]
+
+        digest = file_sha256(self.csv_path)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(sidecar, "w") as f:
+            json.dump({"stamp": stamp, "sha256": digest}, f)
+        return digest
+
+    def path(self) -> Path:
+        digest = self._source_hash()
+        return self.cache_dir / f"{self.csv_path.stem}.v{SCHEMA_VERSION}.{digest[:16]}.{self.format}"
+
+    def build(self) -> Path:
+        """Parse and normalize the CSV and write the typed file, unless it exists"""
+        path = self.path()
+        if path.exists():
+            return path
+
+        logger.info(f"📊 Parsing {self.csv_path} into a typed {self.format} cache")
+        df = normalize(pd.read_csv(self.csv_path))
+        tmp_path = path.with_name(path.name + ".tmp")
+        if self.format == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        tmp_path.replace(path)
+
+        # Caches of earlier versions of the CSV are never read again
+        for old in self.cache_dir.glob(f"{self.csv_path.stem}.v*.*"):
+            if old != path and old.suffix in (".parquet", ".pkl"):
+                old.unlink()
+        logger.info(f"💾 Typed dataset cached at {path}")
+        return path
+
+    def load(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Typed frame, restricted to columns (in that order) if given; unknown columns are skipped"""
+        path = self.build()
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            available = pq.read_schema(path).names
+            wanted = None if columns is None else [column for column in columns if column in available]
+            return pd.read_parquet(path, columns=wanted)
+
+        df = pd.read_pickle(path)
+        if columns is None:
+            return df
+        return df[[column for column in columns if column in df.columns]]
+
+
+def load_dataset(csv_path="riskDBv4_1.csv", columns: Optional[Sequence[str]] = None,
+                 cache_dir: Path = DEFAULT_CACHE_DIR) -> pd.DataFrame:
+    """Typed riskDB frame from the columnar cache, building it on first use"""
+    return DatasetCache(csv_path, cache_dir).load(columns)
+
+
+def main():
+    """Build the columnar cache for riskDBv4_1.csv"""
+    logging.basicConfig(level=logging.INFO)
+    cache = DatasetCache("riskDBv4_1.csv")
+    path = cache.build()
+    df = cache.load()
+    logger.info(f"✅ {path}: {df.shape[0]} rows, {df.shape[1]} columns")
+    logger.info(df.dtypes.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -8,22 +8,39 @@ import sys
 from pathlib import Path
 import pickle
 
+from model_registry import ModelRegistry, SUPPORT_ARTIFACTS
+
 def check_models():
     """Check all model files for corruption"""
     models_dir = Path("models")
+    registry = ModelRegistry(models_dir)
+    manifest = registry.load_manifest()
     
     print("🔍 Checking model files for corruption...\n")
+    if manifest is None:
+        print("⚠️ No manifest.json found, falling back to a full unpickle of each model")
+        print("💡 Run: python model_registry.py to create one\n")
     
     corrupted_models = []
     valid_models = []
     
     for model_file in models_dir.glob("*.pkl"):
-        if model_file.name.startswith("scaler") or model_file.name.startswith("model_info"):
+        if model_file.stem in SUPPORT_ARTIFACTS:
             continue
             
         model_name = model_file.stem
         print(f"Checking {model_name}...")
         
+        if manifest is not None and model_name in manifest["models"]:
+            # Checksum comparison, no unpickling needed
+            if registry.verify(model_name):
+                print(f"  ✅ Valid - checksum matches manifest")
+                valid_models.append(model_name)
+            else:
+                print(f"  ❌ Corrupted - checksum does not match manifest")
+                corrupted_models.append((model_name, model_file))
+            continue
+        
         try:
             with open(model_file, 'rb') as f:
                 model = pickle.load(f)
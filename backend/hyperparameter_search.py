@@ -0,0 +1,202 @@
+"""
+Cross-validated hyperparameter search for the risk models.
+
+Every model is scored with the same stratified folds, computed once per
+preprocessing fingerprint and cached next to the preprocessed matrices. The
+sklearn models use successive halving (HalvingGridSearchCV) across all cores:
+the random forest spends its budget in trees, the others in training rows.
+XGBoost candidates are fit with a generous round limit and stop early on each
+fold's validation log loss, which also picks n_estimators.
+
+The best configs and their CV scores are written to models/tuning.json, which
+training applies on top of the default hyperparameters.
+"""
+
+import itertools
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.metrics import log_loss, roc_auc_score
+from sklearn.model_selection import HalvingGridSearchCV, StratifiedKFold
+
+logger = logging.getLogger(__name__)
+
+TUNING_NAME = "tuning.json"
+SCORING = "roc_auc"
+
+# Halving grids per model key, plus the resource each search allocates
+SEARCH_SPACES = {
+    "logistic_regression": {
+        "grid": {"C": [0.01, 0.1, 0.3, 1.0, 3.0, 10.0], "penalty": ["l1", "l2"]},
+        "resource": "n_samples",
+    },
+    "decision_tree": {
+        "grid": {"max_depth": [3, 4, 5, 6, 8, None], "min_samples_leaf": [1, 5, 10, 20]},
+        "resource": "n_samples",
+    },
+    "random_forest": {
+        "grid": {
+            "max_depth": [4, 5, 6, 8, None],
+            "min_samples_leaf": [1, 5],
+            "max_features": ["sqrt", 0.5],
+        },
+        "resource": "n_estimators",
+        "min_resources": 50,
+        "max_resources": 400,
+    },
+}
+
+XGBOOST_GRID = {
+    "max_depth": [3, 4, 5, 6],
+    "learning_rate": [0.05, 0.1, 0.3],
+    "subsample": [0.8, 1.0],
+}
+XGBOOST_MAX_ROUNDS = 1000
+XGBOOST_EARLY_STOPPING = 25
+
+
+def load_tuning(models_dir) -> Dict[str, Any]:
+    """artifact name -> {"params", "cv"} from the last tuning run"""
+    path = Path(models_dir) / TUNING_NAME
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_tuning(models_dir, tuning: Dict[str, Any]) -> Path:
+    path = Path(models_dir) / TUNING_NAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(tuning, f, indent=2)
+    tmp_path.replace(path)
+    return path
+
+
+def cached_folds(X, y, cache_dir, fingerprint: str, n_splits: int = 5,
+                 random_state: int = 42) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Stratified (train, validation) index pairs, cached per preprocessing fingerprint"""
+    cache_path = Path(cache_dir) / f"{fingerprint[:16]}.folds{n_splits}.joblib"
+    if cache_path.exists():
+        return joblib.load(cache_path)
+
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    folds = [(train.astype(np.int32), valid.astype(np.int32)) for train, valid in splitter.split(X, y)]
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(folds, cache_path)
+    return folds
+
+
+def _jsonable(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+
+
+def tune_sklearn(key: str, estimator, X, y, folds, n_jobs: int) -> Dict[str, Any]:
+    """Successive-halving grid search over SEARCH_SPACES[key]"""
+    space = SEARCH_SPACES[key]
+    options = {name: space[name] for name in ("min_resources", "max_resources") if name in space}
+    search = HalvingGridSearchCV(
+        estimator,
+        space["grid"],
+        cv=folds,
+        scoring=SCORING,
+        resource=space["resource"],
+        factor=3,
+        refit=False,
+        n_jobs=n_jobs,
+        random_state=42,
+        **options
+    )
+    search.fit(X, y)
+
+    best = search.best_index_
+    params = dict(search.best_params_)
+    if space["resource"] == "n_estimators":
+        # The winner was last scored with the largest budget it reached
+        params["n_estimators"] = int(search.cv_results_["n_resources"][best])
+    return {
+        "params": _jsonable(params),
+        "cv": {
+            "metric": SCORING,
+            "mean": float(search.cv_results_["mean_test_score"][best]),
+            "std": float(search.cv_results_["std_test_score"][best]),
+            "folds": len(folds),
+            "candidates": len(search.cv_results_["params"]),
+            "iterations": int(search.n_iterations_),
+        },
+    }
+
+
+def _xgboost_fold(estimator, params, X, y, train, valid) -> Tuple[float, float, int]:
+    model = estimator.set_params(
+        **params,
+        n_estimators=XGBOOST_MAX_ROUNDS,
+        early_stopping_rounds=XGBOOST_EARLY_STOPPING,
+        n_jobs=1,
+    )
+    X_train, X_valid = X.iloc[train], X.iloc[valid]
+    y_train, y_valid = y.iloc[train], y.iloc[valid]
+    model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+    # predict_proba stops at the best iteration once early stopping kicked in
+    proba = model.predict_proba(X_valid)[:, 1]
+    return float(roc_auc_score(y_valid, proba)), float(log_loss(y_valid, proba)), int(model.best_iteration) + 1
+
+
+def tune_xgboost(estimator, X, y, folds, n_jobs: int) -> Dict[str, Any]:
+    """Grid over XGBOOST_GRID; every fit early-stops on its fold's validation log loss"""
+    names = list(XGBOOST_GRID)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*XGBOOST_GRID.values())]
+    # One single-threaded fit per (candidate, fold), spread over every core
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_xgboost_fold)(clone(estimator), params, X, y, train, valid)
+        for params in candidates
+        for train, valid in folds
+    )
+
+    n_folds = len(folds)
+    scored = []
+    for i, params in enumerate(candidates):
+        fold_results = results[i * n_folds:(i + 1) * n_folds]
+        aucs = [result[0] for result in fold_results]
+        losses = [result[1] for result in fold_results]
+        rounds = [result[2] for result in fold_results]
+        scored.append((np.mean(aucs), -np.mean(losses), params, aucs, losses, rounds))
+    mean_auc, neg_loss, params, aucs, losses, rounds = max(scored, key=lambda item: (item[0], item[1]))
+
+    return {
+        "params": _jsonable({**params, "n_estimators": int(round(np.mean(rounds)))}),
+        "cv": {
+            "metric": SCORING,
+            "mean": float(mean_auc),
+            "std": float(np.std(aucs)),
+            "log_loss": float(-neg_loss),
+            "folds": n_folds,
+            "candidates": len(candidates),
+            "best_rounds": rounds,
+        },
+    }
+
+
+def tune(key: str, estimator, X, y, folds, n_jobs: int) -> Dict[str, Any]:
+    """Search one model's hyperparameters; returns {"params", "cv"}"""
+    started = time.perf_counter()
+    if key == "xgboost":
+        result = tune_xgboost(estimator, X, y, folds, n_jobs)
+    else:
+        result = tune_sklearn(key, estimator, X, y, folds, n_jobs)
+    result["cv"]["seconds"] = round(time.perf_counter() - started, 2)
+    result["tuned_at"] = datetime.now().isoformat()
+    logger.info(
+        f"🎛️ {key}: best {result['params']} - CV {SCORING} "
+        f"{result['cv']['mean']:.4f} ± {result['cv']['std']:.4f} ({result['cv']['seconds']:.1f}s)"
+    )
+    return result
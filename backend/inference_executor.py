@@ -0,0 +1,159 @@
+"""
+Bounded executor for CPU-bound model inference.
+
+predict_proba on the tree ensembles holds the CPU for milliseconds; running it
+inline in an async handler stalls every other request on the event loop. The
+executor moves RiskService calls onto a thread or process pool, rejects work
+once the queue is full and gives up on calls that exceed the timeout.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is at capacity"""
+
+
+class InferenceTimeout(Exception):
+    """Raised when an inference call does not finish within the timeout"""
+
+
+# Process-mode workers each own a RiskService built by _init_worker
+_worker_risk_service = None
+
+
+def _init_worker(model_versions: Dict[str, str], scaler_version: str):
+    """Load the artifact set the parent validated, pinned by checksum.
+
+    A file replaced on disk since then is refused rather than loaded, so a
+    worker never serves models other than those /api/risk/models reports.
+    """
+    global _worker_risk_service
+    from services import ModelService, RiskService
+
+    model_service = ModelService()
+    model_service.model_versions.update(model_versions)
+    model_service.scaler_version = scaler_version
+    _worker_risk_service = RiskService(model_service)
+    _worker_risk_service.warm_up()
+
+
+def _call_worker_service(method_name: str, *args, **kwargs):
+    return getattr(_worker_risk_service, method_name)(*args, **kwargs)
+
+
+class InferenceExecutor:
+    """Runs RiskService methods off the event loop with a bounded queue"""
+
+    def __init__(self, risk_service, mode: str = "thread", max_workers: int = 4,
+                 max_queue: int = 64, timeout: float = 10.0):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor mode: {mode}")
+
+        self.risk_service = risk_service
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.mode == "process":
+                model_service = self.risk_service.model_service
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    initargs=(dict(model_service.model_versions), model_service.get_scaler_version())
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+            logger.info(f"⚙️ Started {self.mode} inference pool with {self.max_workers} workers")
+        return self._pool
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a free worker"""
+        return max(0, self._pending - self.max_workers)
+
+    async def run(self, method_name: str, *args, **kwargs) -> Any:
+        """Call risk_service.<method_name>(*args, **kwargs) on the pool"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise InferenceQueueFull(f"Inference queue is full ({self.queue_depth} waiting)")
+            self._pending += 1
+
+        try:
+            pool = self._get_pool()
+            if self.mode == "process":
+                future = pool.submit(_call_worker_service, method_name, *args, **kwargs)
+            else:
+                future = pool.submit(getattr(self.risk_service, method_name), *args, **kwargs)
+        except Exception:
+            # Shut down or replaced by set_risk_service under us: give the slot back
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Drops the call if it is still queued; a running call finishes in the background
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise InferenceTimeout(f"Inference did not finish within {self.timeout:.1f}s")
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "in_flight": min(self._pending, self.max_workers),
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def set_risk_service(self, risk_service):
+        """Route new calls to risk_service; calls already submitted finish on the old one"""
+        self.risk_service = risk_service
+        if self.mode == "process":
+            with self._lock:
+                pool, self._pool = self._pool, None
+            if pool is not None:
+                # Worker processes load their own models: start fresh ones pinned to the
+                # new set on the next call, let the old ones drain
+                pool.shutdown(wait=False)
+                logger.info("♻️ Replacing process inference pool for the new models")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,16 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from contextlib import asynccontextmanager
 import pandas as pd
+import asyncio
 import io
+import os
+import secrets
+import signal
 import logging
 import traceback
+import json
+from pathlib import Path
 from typing import Dict, Any
 
 from models import (
-    SentimentAnalysisRequest, SentimentAnalysisResponse,
-    RiskCalculateRequest, RiskCalculateResponse, RiskFeature
+    SentimentAnalysisRequest, SentimentAnalysisResponse, SentimentBatchRequest,
+    SentimentHistoryResponse, SentimentTrendResponse,
+    RiskCalculateRequest, RiskCalculateResponse, RiskFeature,
+    CounterfactualRequest, CounterfactualResponse,
+    EnsembleRequest, EnsembleResponse, ModelReloadResponse
+)
+from services import ModelService, SentimentService, RiskService, ENSEMBLE_MODEL_NAME
+from model_reloader import ModelReloader
+from inference_executor import InferenceExecutor, InferenceQueueFull, InferenceTimeout
+from risk_batcher import RiskBatcher
+from sentiment_store import SentimentStore, BUCKETS
+from metrics import (
+    REGISTRY, CONTENT_TYPE, MetricsMiddleware, MetricsWriter, SharedMetricsDir, TimedJSONResponse, count_error
 )
-from services import ModelService, SentimentService, RiskService
 from config import settings
 
 # Configure logging
@@ -20,10 +40,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+async def warm_up_models() -> bool:
+    """Warm the live models up; True once the worker can score with every model"""
+    try:
+        await run_in_threadpool(model_reloader.warm_up)
+    except Exception as e:
+        logger.error(f"❌ Model warm-up failed: {e}")
+        count_error("warm_up", e)
+    return model_reloader.model_service.ready
+
+
+async def retry_warm_up():
+    """Keep warming up until it succeeds, so a transient failure doesn't leave the worker unready for good"""
+    while True:
+        logger.warning(f"⚠️ Worker stays not-ready, retrying warm-up in {settings.warm_up_retry_interval}s")
+        await asyncio.sleep(settings.warm_up_retry_interval)
+        if await warm_up_models():
+            logger.info("✅ Warm-up succeeded, worker is ready")
+            return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load and warm up every model before the worker starts taking traffic"""
+    warm_up_task = None
+    if settings.warm_up_models:
+        if not await warm_up_models():
+            warm_up_task = asyncio.create_task(retry_warm_up())
+    else:
+        model_reloader.model_service.ready = True
+    model_reloader.start()
+    if metrics_writer is not None:
+        metrics_writer.start()
+    if sentiment_store is not None:
+        sentiment_store.start()
+    await sentiment_service.start()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await model_reloader.close()
+    if metrics_writer is not None:
+        await metrics_writer.close()
+    await sentiment_service.close()
+    if sentiment_store is not None:
+        # Flushes results still queued for writing
+        await run_in_threadpool(sentiment_store.close)
+    inference_executor.shutdown()
+
+
 app = FastAPI(
     title="MSBA Analysis Dashboard API",
     description="API for risk calculation and sentiment analysis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Times JSON encoding as the "serialization" stage
+    default_response_class=TimedJSONResponse
 )
 
 # CORS middleware
@@ -43,10 +115,71 @@ async def log_requests(request, call_next):
     logger.info(f"📤 Response: {response.status_code}")
     return response
 
-# Initialize services
-model_service = ModelService()
-sentiment_service = SentimentService()
-risk_service = RiskService()
+# Outermost, so request latency includes the other middleware
+app.add_middleware(MetricsMiddleware)
+
+# Initialize services. The live RiskService/ModelService pair sits behind
+# model_reloader, which swaps in a new pair when the artifacts change.
+sentiment_store = SentimentStore(
+    settings.sentiment_history_path,
+    batch_size=settings.sentiment_history_batch_size,
+    flush_interval=settings.sentiment_history_flush_interval,
+    max_queue=settings.sentiment_history_max_queue
+) if settings.sentiment_history_enabled else None
+sentiment_service = SentimentService(sentiment_store)
+model_reloader = ModelReloader(
+    RiskService(ModelService()),
+    poll_interval=settings.model_reload_interval
+)
+inference_executor = InferenceExecutor(
+    model_reloader.risk_service,
+    mode=settings.inference_mode,
+    max_workers=settings.inference_workers,
+    max_queue=settings.inference_max_queue,
+    timeout=settings.inference_timeout
+)
+model_reloader.on_swap = inference_executor.set_risk_service
+# Set by serve.py, so /metrics sums every worker instead of describing whichever answered
+metrics_writer = MetricsWriter(
+    REGISTRY,
+    SharedMetricsDir(settings.metrics_dir),
+    interval=settings.metrics_flush_interval
+) if settings.metrics_dir else None
+risk_batcher = RiskBatcher(
+    inference_executor,
+    max_batch_size=settings.risk_batch_max_size,
+    max_wait_ms=settings.risk_batch_max_wait_ms
+) if settings.risk_batching_enabled else None
+
+
+if risk_batcher is not None:
+    REGISTRY.register_histogram("risk_batch_size", "Requests scored per micro-batch", risk_batcher.batch_sizes)
+    REGISTRY.register_histogram(
+        "risk_batch_wait_milliseconds", "Time a request waited for its micro-batch to fill", risk_batcher.wait_ms
+    )
+
+
+@REGISTRY.collector
+def collect_service_stats():
+    """Queue, model cache and result cache counters, read at scrape time"""
+    inference = inference_executor.stats()
+    yield "inference_in_flight", "gauge", "Risk computations running now", [({}, inference["in_flight"])]
+    yield "inference_queue_depth", "gauge", "Risk computations waiting for a worker", [({}, inference["queue_depth"])]
+    for key in ("completed", "rejected", "timed_out"):
+        yield f"inference_{key}_total", "counter", f"Risk computations {key.replace('_', ' ')}", [({}, inference[key])]
+    
+    model_cache = model_reloader.model_service.model_cache.stats()
+    yield "model_cache_resident_bytes", "gauge", "Estimated memory held by cached models", [({}, model_cache["resident_bytes"])]
+    for key in ("hits", "misses", "evictions", "loads"):
+        yield f"model_cache_{key}_total", "counter", f"Model cache {key} per model", [
+            ({"model": name}, counters[key]) for name, counters in sorted(model_cache["models"].items())
+        ]
+    
+    result_cache = model_reloader.risk_service.result_cache
+    if result_cache is not None:
+        counters = result_cache.stats()
+        for key in ("hits", "misses", "evictions"):
+            yield f"risk_result_cache_{key}_total", "counter", f"Risk score cache {key}", [({}, counters[key])]
 
 
 @app.get("/")
@@ -65,58 +198,291 @@ async def analyze_sentiment(
         return result
         
     except Exception as e:
+        count_error("sentiment", e)
         raise HTTPException(status_code=500, detail=f"Error analyzing sentiment: {str(e)}")
 
 
+@app.get("/api/sentiment-analysis/stream")
+async def stream_sentiment(company_name: str = Query(..., min_length=1)):
+    """Server-sent events: sources, analysis deltas, then the SentimentAnalysisResponse"""
+    logger.info(f"📰 Streaming sentiment request - {company_name}")
+    
+    async def events():
+        try:
+            async for event, data in sentiment_service.stream_sentiment(company_name):
+                if event == "result":
+                    data = SentimentAnalysisResponse(**data).model_dump(mode="json")
+                yield f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+        except Exception as e:
+            logger.error(f"❌ Streaming sentiment error: {str(e)}")
+            count_error("sentiment_stream", e)
+            yield f"event: error\ndata: {json.dumps({'detail': f'Error analyzing sentiment: {str(e)}'})}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/sentiment-analysis/batch")
+async def analyze_sentiment_batch(request: SentimentBatchRequest):
+    """Analyze a watchlist of companies, streaming NDJSON lines as each one finishes"""
+    if len(request.company_names) > settings.sentiment_batch_max_companies:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.sentiment_batch_max_companies} companies per batch"
+        )
+    logger.info(f"📰 Batch sentiment request - {len(request.company_names)} companies")
+    
+    async def stream():
+        async for item in sentiment_service.analyze_many(request.company_names, request.max_concurrency):
+            yield json.dumps(jsonable_encoder(item)) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/api/sentiment-analysis/cache")
+async def get_sentiment_cache():
+    """Sentiment cache hit rate and upstream call counts"""
+    return sentiment_service.cache_stats()
+
+
+@app.get("/api/sentiment-analysis/history", response_model=SentimentHistoryResponse)
+async def get_sentiment_history(
+    company_name: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=500)
+) -> Dict[str, Any]:
+    """Latest stored analyses for a company, newest first, without re-running anything"""
+    if sentiment_store is None:
+        raise HTTPException(status_code=404, detail="Sentiment history is disabled")
+    try:
+        entries = await run_in_threadpool(sentiment_store.latest, company_name, limit)
+        return {"company_name": company_name, "entries": entries}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading sentiment history: {str(e)}")
+
+
+@app.get("/api/sentiment-analysis/trend", response_model=SentimentTrendResponse)
+async def get_sentiment_trend(
+    company_name: str = Query(..., min_length=1),
+    days: int = Query(30, ge=1, le=3650),
+    bucket: str = Query("day", pattern=f"^({'|'.join(BUCKETS)})$")
+) -> Dict[str, Any]:
+    """Average, min and max stored sentiment per hour/day/week/month"""
+    if sentiment_store is None:
+        raise HTTPException(status_code=404, detail="Sentiment history is disabled")
+    try:
+        points = await run_in_threadpool(sentiment_store.trend, company_name, days, bucket)
+        return {"company_name": company_name, "bucket": bucket, "days": days, "points": points}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading sentiment trend: {str(e)}")
+
+
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": pd.Timestamp.now()}
+    if not model_reloader.model_service.ready:
+        # 503 keeps load balancers from routing to a worker that is still warming up
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "timestamp": pd.Timestamp.now().isoformat()}
+        )
+    return {
+        "status": "healthy",
+        "timestamp": pd.Timestamp.now(),
+        "worker_pid": os.getpid(),
+        "models_loaded": list(model_reloader.model_service.loaded_models.keys()),
+        "model_set": model_reloader.stats(),
+        "inference": inference_executor.stats()
+    }
 
 
 @app.post("/api/risk/calculate", response_model=RiskCalculateResponse)
-async def calculate_risk(request: RiskCalculateRequest) -> Dict[str, Any]:
+async def calculate_risk(request: RiskCalculateRequest, raw_request: Request) -> Dict[str, Any]:
     """Calculate startup failure risk based on feature values"""
     logger.info(f"🎯 Risk calculation request - Model: {request.model_name}")
     
     try:
-        result = risk_service.calculate_risk(
-            feature_values=request.feature_values,
-            model_name=request.model_name
-        )
+        if risk_batcher is not None:
+            result = await risk_batcher.submit(request.feature_values, request.model_name)
+        else:
+            result = await inference_executor.run(
+                "calculate_risk",
+                feature_values=request.feature_values,
+                model_name=request.model_name
+            )
         logger.info(f"📊 Risk calculated: {result['risk_score']:.3f} ({result['risk_level']})")
+        # Labelled only once scoring succeeded, so unknown names never become series
+        raw_request.state.model_name = request.model_name
         return result
         
+    except InferenceQueueFull as e:
+        logger.warning(f"⚠️ {e}")
+        count_error("risk_calculate", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except InferenceTimeout as e:
+        logger.warning(f"⚠️ {e}")
+        count_error("risk_calculate", e)
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Risk calculation error: {str(e)}")
+        count_error("risk_calculate", e)
         logger.error(f"🔍 Full traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Risk calculation failed: {str(e)}")
 
+@app.post("/api/risk/ensemble", response_model=EnsembleResponse)
+async def calculate_ensemble(request: EnsembleRequest) -> Dict[str, Any]:
+    """Score the input with every model and combine them with metric-based weights"""
+    logger.info(f"🎯 Ensemble request - Models: {request.model_names or 'all'}")
+    
+    try:
+        result = await inference_executor.run(
+            "calculate_ensemble",
+            feature_values=request.feature_values,
+            model_names=request.model_names,
+            parallel=request.parallel,
+            weight_metric=request.weight_metric
+        )
+        logger.info(f"📊 Ensemble risk: {result['risk_score']:.3f} ({result['risk_level']})")
+        return result
+        
+    except InferenceQueueFull as e:
+        count_error("risk_ensemble", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except InferenceTimeout as e:
+        count_error("risk_ensemble", e)
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Ensemble calculation error: {str(e)}")
+        count_error("risk_ensemble", e)
+        logger.error(f"🔍 Full traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Ensemble calculation failed: {str(e)}")
+
+@app.post("/api/risk/counterfactual", response_model=CounterfactualResponse)
+async def find_counterfactuals(request: CounterfactualRequest, raw_request: Request) -> Dict[str, Any]:
+    """Find the smallest slider changes that bring the risk below a target"""
+    logger.info(f"🔎 Counterfactual request - Model: {request.model_name}, Target: {request.target_risk}")
+    
+    try:
+        result = await inference_executor.run(
+            "find_counterfactuals",
+            feature_values=request.feature_values,
+            model_name=request.model_name,
+            target_risk=request.target_risk,
+            max_changes=request.max_changes,
+            budget=request.budget,
+            max_results=request.max_results
+        )
+        raw_request.state.model_name = request.model_name
+        return result
+        
+    except InferenceQueueFull as e:
+        count_error("risk_counterfactual", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except InferenceTimeout as e:
+        count_error("risk_counterfactual", e)
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Counterfactual search error: {str(e)}")
+        count_error("risk_counterfactual", e)
+        logger.error(f"🔍 Full traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Counterfactual search failed: {str(e)}")
+
+@app.post("/api/analyze-csv")
+async def analyze_csv(
+    raw_request: Request,
+    file: UploadFile = File(...),
+    model_name: str = "xgboost_model",
+    output_format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    chunk_size: int = Query(None, gt=0)
+):
+    """Score every row of an uploaded CSV and stream the results back"""
+    logger.info(f"📁 CSV scoring request - File: {file.filename}, Model: {model_name}, Format: {output_format}")
+    
+    # The whole file is scored by the models live now, even if a reload swaps them mid-stream
+    risk_service = model_reloader.risk_service
+    # Fail before streaming starts so the client gets a proper status code
+    try:
+        model_version = risk_service.model_version(model_name)
+    except FileNotFoundError as e:
+        count_error("analyze_csv", e)
+        raise HTTPException(status_code=404, detail=str(e))
+    raw_request.state.model_name = model_name
+    
+    media_type = "application/x-ndjson" if output_format == "ndjson" else "text/csv"
+    stem = Path(file.filename or "upload").stem
+    extension = "ndjson" if output_format == "ndjson" else "csv"
+    return StreamingResponse(
+        risk_service.score_csv_stream(file.file, model_name, output_format, chunk_size),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{stem}_scored.{extension}"',
+            "X-Model-Version": model_version
+        }
+    )
+
+@app.get("/api/risk/queue")
+async def get_risk_queue():
+    """Inference pool occupancy, queue depth and micro-batching histograms"""
+    stats = inference_executor.stats()
+    stats["batching"] = risk_batcher.stats() if risk_batcher is not None else None
+    return stats
+
+@app.get("/api/risk/cache")
+async def get_risk_cache():
+    """Risk score cache size and hit/miss counters"""
+    result_cache = model_reloader.risk_service.result_cache
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+@app.get("/api/risk/model-cache")
+async def get_model_cache():
+    """Resident models with their estimated size, hit/miss, eviction and load-latency counters"""
+    return model_reloader.model_service.model_cache.stats()
+
 @app.get("/api/risk/features")
 async def get_risk_features():
     """Get feature definitions for the risk calculator"""
     try:
-        features = risk_service.get_feature_definitions()
+        features = model_reloader.risk_service.get_feature_definitions()
         logger.info(f"📋 Returning {len(features)} feature definitions")
         return {"features": features}
         
     except Exception as e:
         logger.error(f"❌ Error getting risk features: {str(e)}")
+        count_error("risk_features", e)
         raise HTTPException(status_code=500, detail=f"Error getting features: {str(e)}")
 
 @app.get("/api/risk/models")
 async def get_risk_models():
     """Get available models for risk calculation"""
     try:
-        available_models = model_service.get_available_models()
+        catalog = model_reloader.model_service.get_model_catalog()
         
         # Format for risk calculator
         models = []
-        for model_name in available_models:
+        for entry in catalog:
+            model_name = entry["name"]
             display_name = model_name.replace("_", " ").title()
             models.append({
                 "name": model_name,
                 "display_name": display_name,
-                "accuracy": 0.85  # Mock accuracy for now
+                "accuracy": entry["metrics"].get("accuracy"),
+                "metrics": entry["metrics"],
+                # Best hyperparameters and CV scores, when the model was tuned
+                "tuning": entry.get("tuning")
+            })
+        
+        if len(models) > 1:
+            # Weighted blend of every model, also selectable as model_name on /api/risk/calculate
+            models.append({
+                "name": ENSEMBLE_MODEL_NAME,
+                "display_name": "Weighted Ensemble",
+                "accuracy": None,
+                "metrics": {},
+                "tuning": None
             })
         
         logger.info(f"🤖 Returning {len(models)} available models")
@@ -124,8 +490,35 @@ async def get_risk_models():
         
     except Exception as e:
         logger.error(f"❌ Error getting risk models: {str(e)}")
+        count_error("risk_models", e)
         raise HTTPException(status_code=500, detail=f"Error getting models: {str(e)}")
 
+@app.post("/api/admin/models/reload", response_model=ModelReloadResponse)
+async def reload_models(force: bool = False, x_admin_token: str = Header(None)) -> Dict[str, Any]:
+    """Load the artifacts in models/, validate them and swap them in without dropping requests"""
+    # Every reload rebuilds and smoke-tests all models, so it is never open to anonymous callers
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Model reload is disabled until ADMIN_TOKEN is set")
+    if not secrets.compare_digest(x_admin_token or "", settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    if model_reloader.supervisor_pid is not None:
+        # Behind serve.py the supervisor reloads once and rolls every worker over
+        os.kill(model_reloader.supervisor_pid, signal.SIGHUP)
+        return {"status": "scheduled", "version": model_reloader.version}
+
+    result = await run_in_threadpool(model_reloader.reload, force)
+    if result["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {result['error']}")
+    return result
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the request, stage, upstream and cache metrics (all workers under serve.py)"""
+    if metrics_writer is not None:
+        return Response(await run_in_threadpool(metrics_writer.render), media_type=CONTENT_TYPE)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 
 if __name__ == "__main__":
     import uvicorn
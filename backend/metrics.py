@@ -0,0 +1,474 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Histograms and counters are plain Python objects guarded by a lock per
+series, so recording a value costs a bisect and a few additions. Everything
+registered in REGISTRY, plus whatever the collectors report at scrape time
+(queue depths, cache counters), is rendered by GET /metrics.
+
+Behind serve.py the workers also write snapshots of their series to a shared
+directory (SharedMetricsDir), and /metrics renders the sum over all of them,
+whichever worker answers. When a worker exits, the supervisor folds its
+counters and histograms into an archive, so totals never go backwards when
+workers are recycled; its gauges are dropped.
+"""
+
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Seconds; from a cached tree-engine row up to a slow upstream call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count, Prometheus style"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        # bisect_left puts a value equal to a bound in that bucket (Prometheus "le")
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        with self._lock:
+            counts = list(self.counts)
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + [math.inf], counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {
+            "+Inf" if bound == math.inf else str(bound): count
+            for bound, count in self.cumulative()
+        }
+        return {
+            "buckets": buckets,
+            "sum": self.sum,
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+        }
+
+
+class _Family:
+    """One metric name with a series per combination of label values"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(name suffix, labels, value) of every series, e.g. ("_sum", {...}, 1.5)"""
+        samples = []
+        for values, series in sorted(list(self._series.items())):
+            samples.extend(self._series_samples(dict(zip(self.labelnames, values)), series))
+        return samples
+
+    def _series_samples(self, labels: Dict[str, str], series) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_series(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0, **labels):
+        self.labels(**labels).inc(amount)
+
+    def _series_samples(self, labels, series):
+        return [("", labels, series.value)]
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_series(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with-block, if it completes"""
+        started = time.perf_counter()
+        yield
+        self.labels(**labels).observe(time.perf_counter() - started)
+
+    def _series_samples(self, labels, series):
+        samples = [
+            ("_bucket", {**labels, "le": "+Inf" if bound == math.inf else _number(bound)}, count)
+            for bound, count in series.cumulative()
+        ]
+        samples.append(("_sum", labels, series.sum))
+        samples.append(("_count", labels, series.count))
+        return samples
+
+
+class _Existing(HistogramFamily):
+    """An unlabeled Histogram owned by another component (e.g. RiskBatcher)"""
+
+    def __init__(self, name: str, documentation: str, histogram: Histogram):
+        super().__init__(name, documentation, (), histogram.buckets)
+        self._series[()] = histogram
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        # Called at scrape time; yield (name, type, help, [(labels, value)])
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, family: _Family) -> _Family:
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                return existing
+            self._families[family.name] = family
+            return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> HistogramFamily:
+        return self._add(HistogramFamily(name, documentation, labelnames, buckets))
+
+    def register_histogram(self, name: str, documentation: str, histogram: Histogram):
+        """Expose a Histogram another component already records into"""
+        with self._lock:
+            self._families[name] = _Existing(name, documentation, histogram)
+
+    def collector(self, collect: Callable):
+        self._collectors.append(collect)
+        return collect
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of every family: name -> {type, help, samples: [[suffix, labels, value]]}"""
+        snapshot = {}
+        for family in list(self._families.values()):
+            snapshot[family.name] = {
+                "type": family.kind,
+                "help": family.documentation,
+                "samples": [list(sample) for sample in family.samples()],
+            }
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                snapshot[name] = {
+                    "type": kind,
+                    "help": documentation,
+                    "samples": [["", labels, value] for labels, value in samples],
+                }
+        return snapshot
+
+    def render(self) -> str:
+        return render_snapshot(self.collect())
+
+
+def render_snapshot(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    lines = []
+    for name, family in snapshot.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for suffix, labels, value in family["samples"]:
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            series = f"{name}{suffix}{{{label_text}}}" if label_text else f"{name}{suffix}"
+            lines.append(f"{series} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[str, Any]]], gauges: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Sum snapshots series by series; gauges are left out unless gauges is set"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    values: Dict[str, Dict[tuple, list]] = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            if family["type"] == "gauge" and not gauges:
+                continue
+            if name not in merged:
+                merged[name] = {"type": family["type"], "help": family["help"], "samples": []}
+                values[name] = {}
+            series = values[name]
+            for suffix, labels, value in family["samples"]:
+                key = (suffix, tuple(labels.items()))
+                sample = series.get(key)
+                if sample is None:
+                    series[key] = sample = [suffix, labels, 0]
+                    merged[name]["samples"].append(sample)
+                sample[2] += value
+    return merged
+
+
+class SharedMetricsDir:
+    """Metric snapshots of every serve.py worker, summed when read.
+
+    Each worker replaces <pid>.json with its latest snapshot. When one exits,
+    the supervisor merges its counters and histograms into archive.json under
+    an exclusive lock, which readers take shared, so no scrape ever counts a
+    worker twice or loses a finished one.
+    """
+
+    ARCHIVE = "archive.json"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.path / ".lock"
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, name: str, snapshot: Dict[str, Any]):
+        tmp_path = self.path / f".{name}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        tmp_path.replace(self.path / name)
+
+    def _load(self, path: Path) -> Dict[str, Any]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def reset(self):
+        """Drop snapshots left over from an earlier run"""
+        with self._locked(exclusive=True):
+            for path in self.path.glob("*.json"):
+                path.unlink()
+
+    def write(self, snapshot: Dict[str, Any], pid: Optional[int] = None):
+        self._write(f"{pid or os.getpid()}.json", snapshot)
+
+    def archive(self, pid: int):
+        """Fold an exited worker's counters and histograms into the archive"""
+        path = self.path / f"{pid}.json"
+        with self._locked(exclusive=True):
+            if not path.exists():
+                return
+            archived = merge_snapshots([self._load(self.path / self.ARCHIVE), self._load(path)], gauges=False)
+            self._write(self.ARCHIVE, archived)
+            path.unlink()
+
+    def read(self) -> Dict[str, Any]:
+        """Archive plus every live worker's latest snapshot, summed"""
+        with self._locked(exclusive=False):
+            return merge_snapshots(self._load(path) for path in sorted(self.path.glob("*.json")))
+
+
+class MetricsWriter:
+    """Keeps this worker's snapshot in a SharedMetricsDir current"""
+
+    def __init__(self, registry: "MetricsRegistry", shared: SharedMetricsDir, interval: float = 1.0):
+        self.registry = registry
+        self.shared = shared
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._task = None
+
+    def flush(self):
+        with self._lock:
+            self.shared.write(self.registry.collect())
+
+    def render(self) -> str:
+        """Every worker's metrics summed, this one's as of now"""
+        self.flush()
+        return render_snapshot(self.shared.read())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not write metrics snapshot: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Last snapshot, for the supervisor to archive once this worker exits
+        self.flush()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ["method", "route", "status", "model"],
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "risk_stage_duration_seconds",
+    "Time spent in each stage of risk scoring",
+    ["stage", "model"],
+    buckets=STAGE_BUCKETS,
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds",
+    "Latency of sentiment upstream calls (web search, LLM)",
+    ["service", "outcome"],
+)
+ERRORS = REGISTRY.counter(
+    "errors_total",
+    "Errors caught and reported, by where they happened and exception type",
+    ["where", "kind"],
+)
+FALLBACKS = REGISTRY.counter(
+    "risk_fallbacks_total",
+    "Times scoring fell back to a slower path",
+    ["model", "kind"],
+)
+
+
+def count_error(where: str, error: BaseException):
+    ERRORS.inc(where=where, kind=type(error).__name__)
+
+
+@contextmanager
+def time_upstream(service: str):
+    """Observe an upstream call's latency with outcome ok/error (cancellations are not recorded)"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service=service, outcome="error")
+        count_error(f"upstream_{service}", e)
+        raise
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, service=service, outcome="ok")
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose encoding is recorded as the serialization stage"""
+
+    def render(self, content: Any) -> bytes:
+        with STAGE_SECONDS.time(stage="serialization", model=""):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording HTTP_REQUEST_SECONDS per route template.
+
+    An endpoint can set request.state.model_name to add the model label; it
+    should only do so for names it has validated, to keep label values bounded.
+    """
+
+    def __init__(self, app, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+                model=scope.get("state", {}).get("model_name", ""),
+            )
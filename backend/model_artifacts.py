@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Fast-loading model artifacts written next to the .pkl files.
+
+XGBoost models are saved in the library's native UBJSON format, which loads
+without going through pickle and across XGBoost versions. Large sklearn models
+are dumped uncompressed with joblib, so their numpy arrays sit unmodified in
+the file and can be loaded with mmap_mode="r": the pages come from the OS page
+cache, read-only and shared by every worker that maps the same file.
+
+sklearn tree models keep their pickles: Tree.__setstate__ copies the node
+arrays into C structs, so mapping them saves no memory, and mapping hundreds of
+small per-tree arrays loads several times slower than unpickling
+(benchmark_artifacts.py). Small models stay pickled for the same reason.
+
+The .pkl stays the canonical artifact (checksums, versions); ModelService
+prefers the fast artifact when the manifest lists it and its checksum matches.
+
+Run this module directly to write fast artifacts for existing .pkl models and
+refresh the manifest.
+"""
+
+import logging
+import pickle
+from pathlib import Path
+from typing import Optional
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+JOBLIB_SUFFIX = ".joblib"
+XGBOOST_SUFFIX = ".ubj"
+FAST_SUFFIXES = (XGBOOST_SUFFIX, JOBLIB_SUFFIX)
+
+# Below this pickled size, mapping arrays costs more than it saves
+MMAP_MIN_BYTES = 1 << 20
+
+
+def _copies_on_load(model) -> bool:
+    """True for sklearn trees and tree ensembles"""
+    estimators = getattr(model, "estimators_", [])
+    return hasattr(model, "tree_") or any(hasattr(estimator, "tree_") for estimator in estimators)
+
+
+def fast_format(model, min_bytes: int = MMAP_MIN_BYTES):
+    """Suffix of the fast artifact worth writing for model, or None to keep only the pickle"""
+    if type(model).__name__.startswith("XGB"):
+        return XGBOOST_SUFFIX
+    if _copies_on_load(model):
+        return None
+    if len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) < min_bytes:
+        return None
+    return JOBLIB_SUFFIX
+
+
+def save_fast_artifact(model, models_dir: Path, model_name: str, suffix: Optional[str] = None) -> Optional[Path]:
+    """Write model in its fast-loading format, atomically; None if it has none (see fast_format)"""
+    suffix = suffix or fast_format(model)
+    path = Path(models_dir) / f"{model_name}{suffix}" if suffix else None
+    if path is not None:
+        tmp_path = path.with_name(f"{path.stem}.tmp{path.suffix}")
+        if suffix == XGBOOST_SUFFIX:
+            model.save_model(tmp_path)
+        else:
+            # No compression: compressed arrays cannot be memory-mapped
+            joblib.dump(model, tmp_path, compress=0)
+        tmp_path.replace(path)
+
+    # A retrained model must not leave an older fast artifact behind
+    for stale_suffix in FAST_SUFFIXES:
+        stale = Path(models_dir) / f"{model_name}{stale_suffix}"
+        if stale != path and stale.exists():
+            stale.unlink()
+    return path
+
+
+def load_fast_artifact(path: Path):
+    """Load a fast artifact; joblib arrays are memory-mapped read-only"""
+    path = Path(path)
+    if path.suffix == XGBOOST_SUFFIX:
+        from xgboost import XGBClassifier
+        model = XGBClassifier()
+        model.load_model(path)
+        return model
+    return joblib.load(path, mmap_mode="r")
+
+
+def find_fast_artifact(models_dir: Path, model_name: str) -> Optional[Path]:
+    for suffix in FAST_SUFFIXES:
+        path = Path(models_dir) / f"{model_name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def main():
+    """Write fast artifacts for every model .pkl and rebuild the manifest.
+
+    --all writes one for every model, even where fast_format would keep the
+    pickle, so benchmark_artifacts.py can compare both paths.
+    """
+    import argparse
+    from model_registry import SUPPORT_ARTIFACTS, main as rebuild_manifest
+
+    parser = argparse.ArgumentParser(description="Write fast-loading model artifacts")
+    parser.add_argument("--all", action="store_true", help="Also convert models that load faster as pickles")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    models_dir = Path("models")
+    for pkl_path in sorted(models_dir.glob("*.pkl")):
+        if pkl_path.stem in SUPPORT_ARTIFACTS:
+            continue
+        with open(pkl_path, "rb") as f:
+            model = pickle.load(f)
+        suffix = fast_format(model) or (JOBLIB_SUFFIX if args.all else None)
+        path = save_fast_artifact(model, models_dir, pkl_path.stem, suffix)
+        logger.info(f"💾 {pkl_path.name} -> {path.name if path else 'kept as pickle'}")
+    rebuild_manifest()
+
+
+if __name__ == "__main__":
+    main()
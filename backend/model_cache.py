@@ -0,0 +1,170 @@
+"""
+Memory-budgeted LRU cache for loaded models and scalers.
+
+Every entry is charged its estimated in-memory size: the pickled bytes of the
+object, with numpy buffers counted out-of-band so nothing large is copied to
+measure it. When the resident total goes over the budget, the least recently
+used entries are evicted (pinned ones, like the scaler every feature plan
+shares, only count towards the total) and eviction listeners (RiskService's feature plans,
+which hold references to the models) let go of them too. Per-model hit/miss,
+load-latency and eviction counters survive eviction.
+"""
+
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+def estimate_nbytes(obj) -> int:
+    """Approximate resident size of obj: its pickle plus out-of-band numpy buffers"""
+    buffers = []
+    try:
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not estimate the size of {type(obj).__name__}: {e}")
+        return 0
+    return len(data) + sum(buffer.raw().nbytes for buffer in buffers)
+
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "loaded_at")
+
+    def __init__(self, value, nbytes: int):
+        self.value = value
+        self.nbytes = nbytes
+        self.loaded_at = time.time()
+
+
+class ModelCache:
+    """Named objects kept under max_bytes, least recently used evicted first"""
+
+    def __init__(self, max_bytes: Optional[int] = None, pinned: Tuple[str, ...] = ()):
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        # name -> counters, created on a name's first load and kept after it is
+        # evicted; lookups of names never loaded (e.g. bad requests) add nothing
+        self._stats: Dict[str, Dict[str, float]] = {}
+        # Called with each evicted name, outside the lock
+        self.eviction_listeners: List[Callable[[str], None]] = []
+
+    def _counters(self, name: str) -> Dict[str, float]:
+        counters = self._stats.get(name)
+        if counters is None:
+            counters = self._stats[name] = {
+                "hits": 0, "misses": 0, "loads": 0, "evictions": 0,
+                "load_seconds_total": 0.0, "last_load_seconds": None,
+            }
+        return counters
+
+    def get(self, name: str, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                counters = self._stats.get(name)
+                if counters is not None:
+                    counters["misses"] += 1
+                return default
+            self._entries.move_to_end(name)
+            self._counters(name)["hits"] += 1
+            return entry.value
+
+    def peek(self, name: str, default: Any = MISSING) -> Any:
+        """Like get, without touching recency or counters"""
+        with self._lock:
+            entry = self._entries.get(name)
+            return default if entry is None else entry.value
+
+    def put(self, name: str, value: Any, load_seconds: float = 0.0, nbytes: Optional[int] = None):
+        """Store a freshly loaded object, then evict down to the budget"""
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self.resident_bytes -= previous.nbytes
+            self._entries[name] = _Entry(value, nbytes)
+            self.resident_bytes += nbytes
+            if name not in self._stats:
+                # Counters start here; count the miss that led to this first load
+                self._counters(name)["misses"] += 1
+            counters = self._counters(name)
+            counters["loads"] += 1
+            counters["load_seconds_total"] += load_seconds
+            counters["last_load_seconds"] = load_seconds
+            evicted = self._evict_locked(keep=name)
+        self._notify(evicted)
+
+    def charge(self, name: str, nbytes: int):
+        """Add memory held on name's behalf elsewhere (e.g. its compiled evaluator)"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry.nbytes += nbytes
+            self.resident_bytes += nbytes
+            evicted = self._evict_locked(keep=name)
+        self._notify(evicted)
+
+    def _evict_locked(self, keep: str) -> List[str]:
+        evicted = []
+        if self.max_bytes is None:
+            return evicted
+        while self.resident_bytes > self.max_bytes:
+            victim = next((name for name in self._entries if name != keep and name not in self.pinned), None)
+            if victim is None:
+                logger.warning(f"⚠️ {keep} alone ({self.resident_bytes / 2**20:.1f} MB) exceeds the model cache budget")
+                break
+            entry = self._entries.pop(victim)
+            self.resident_bytes -= entry.nbytes
+            self._counters(victim)["evictions"] += 1
+            evicted.append(victim)
+        return evicted
+
+    def _notify(self, evicted: List[str]):
+        for name in evicted:
+            logger.info(f"🧹 Evicted {name} from the model cache")
+            for listener in self.eviction_listeners:
+                listener(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def items(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: entry.value for name, entry in self._entries.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {}
+            for name, counters in self._stats.items():
+                entry = self._entries.get(name)
+                lookups = counters["hits"] + counters["misses"]
+                models[name] = {
+                    "resident": entry is not None,
+                    "bytes": entry.nbytes if entry is not None else 0,
+                    "hits": counters["hits"],
+                    "misses": counters["misses"],
+                    "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+                    "loads": counters["loads"],
+                    "evictions": counters["evictions"],
+                    "last_load_ms": None if counters["last_load_seconds"] is None
+                    else counters["last_load_seconds"] * 1000,
+                    "mean_load_ms": counters["load_seconds_total"] / counters["loads"] * 1000
+                    if counters["loads"] else None,
+                }
+            return {
+                "max_bytes": self.max_bytes,
+                "resident_bytes": self.resident_bytes,
+                "resident": len(self._entries),
+                "evictions": sum(counters["evictions"] for counters in self._stats.values()),
+                "models": models,
+            }
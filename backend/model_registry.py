@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Model manifest and registry.
+
+Training writes models/manifest.json describing every artifact (checksum, size,
+feature list, metrics). The registry validates the files on disk against it
+without unpickling anything: a file is re-hashed only when its size or mtime
+changes, so listing models is a metadata read.
+
+Run this module directly to (re)build the manifest for existing artifacts.
+"""
+
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from model_artifacts import find_fast_artifact
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Support artifacts that live next to the models but are not models themselves
+SUPPORT_ARTIFACTS = ("scaler", "model_info")
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Hash a file in chunks so large artifacts never sit in memory twice"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_key(model_name: str) -> str:
+    """Map an artifact name onto its model_info key, e.g. xgboost_model -> xgboost"""
+    return model_name[:-len("_model")] if model_name.endswith("_model") else model_name
+
+
+def build_manifest(models_dir: Path, model_info: Dict[str, Any],
+                   model_metrics: Optional[Dict[str, Dict[str, float]]] = None,
+                   model_features: Optional[Dict[str, List[str]]] = None,
+                   model_tuning: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Describe every .pkl artifact in models_dir.
+
+    model_metrics, model_features and model_tuning (best hyperparameters and CV
+    scores) are keyed by artifact name; missing metrics and features fall back
+    to model_info's model_performance accuracy and predictors.
+    """
+    models_dir = Path(models_dir)
+    model_metrics = model_metrics or {}
+    model_features = model_features or {}
+    model_tuning = model_tuning or model_info.get("tuning") or {}
+    performance = model_info.get("model_performance", {})
+
+    manifest = {
+        "manifest_version": MANIFEST_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "predictors": model_info.get("predictors", []),
+        "scale_features": model_info.get("scale_features", []),
+        "leave_unscaled": model_info.get("leave_unscaled", []),
+        "models": {},
+        "artifacts": {},
+    }
+
+    for path in sorted(models_dir.glob("*.pkl")):
+        name = path.stem
+        entry = {
+            "file": path.name,
+            "sha256": file_sha256(path),
+            "size": path.stat().st_size,
+        }
+        if name in SUPPORT_ARTIFACTS:
+            manifest["artifacts"][name] = entry
+            continue
+
+        metrics = dict(model_metrics.get(name, {}))
+        if "accuracy" not in metrics and model_key(name) in performance:
+            metrics["accuracy"] = float(performance[model_key(name)])
+        entry["features"] = list(model_features.get(name, model_info.get("predictors", [])))
+        entry["metrics"] = metrics
+        fast_path = find_fast_artifact(models_dir, name)
+        if fast_path is not None:
+            entry["fast_artifact"] = {
+                "file": fast_path.name,
+                "sha256": file_sha256(fast_path),
+                "size": fast_path.stat().st_size,
+            }
+        if name in model_tuning:
+            entry["tuning"] = model_tuning[name]
+        manifest["models"][name] = entry
+
+    return manifest
+
+
+def write_manifest(models_dir: Path, model_info: Dict[str, Any],
+                   model_metrics: Optional[Dict[str, Dict[str, float]]] = None,
+                   model_features: Optional[Dict[str, List[str]]] = None,
+                   model_tuning: Optional[Dict[str, Dict[str, Any]]] = None) -> Path:
+    """Build the manifest and write it atomically next to the artifacts"""
+    models_dir = Path(models_dir)
+    manifest = build_manifest(models_dir, model_info, model_metrics, model_features, model_tuning)
+
+    manifest_path = models_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(manifest_path)
+
+    logger.info(f"💾 Manifest with {len(manifest['models'])} models saved to {manifest_path}")
+    return manifest_path
+
+
+class ModelRegistry:
+    """Cached view of the manifest plus hash validation of the files it lists"""
+
+    def __init__(self, models_dir: Path):
+        self.models_dir = Path(models_dir)
+        self.manifest_path = self.models_dir / MANIFEST_NAME
+        self._manifest = None
+        self._manifest_stamp = None
+        # file name -> ((size, mtime_ns), sha256) so unchanged files are never re-hashed
+        self._hash_cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path: Path):
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Return the parsed manifest, re-reading it only when the file changes"""
+        with self._lock:
+            if not self.manifest_path.exists():
+                if self._manifest is not None:
+                    logger.warning(f"⚠️ Manifest disappeared from {self.models_dir}")
+                self._manifest = None
+                self._manifest_stamp = None
+                return None
+
+            stamp = self._stamp(self.manifest_path)
+            if stamp != self._manifest_stamp:
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+                self._manifest_stamp = stamp
+                logger.info(f"✅ Loaded manifest with {len(self._manifest.get('models', {}))} models")
+            return self._manifest
+
+    def _current_hash(self, path: Path) -> str:
+        stamp = self._stamp(path)
+        with self._lock:
+            cached = self._hash_cache.get(path.name)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        digest = file_sha256(path)
+        with self._lock:
+            self._hash_cache[path.name] = (stamp, digest)
+        return digest
+
+    def file_hash(self, name: str) -> str:
+        """sha256 of an artifact, served from cache while the file is unchanged"""
+        return self._current_hash(self.models_dir / f"{name}.pkl")
+
+    def verify(self, name: str) -> bool:
+        """Check a model or support artifact against its manifest checksum.
+
+        With a manifest, a model it does not list is rejected, the same as one
+        whose hash changed, so only what list_models reports is ever served.
+        Rebuild the manifest (python model_registry.py) after copying a model in
+        by hand. Unlisted support artifacts are accepted with a warning.
+        """
+        manifest = self.load_manifest()
+        path = self.models_dir / f"{name}.pkl"
+        if not path.exists():
+            return False
+        if manifest is None:
+            return True
+
+        entry = manifest["models"].get(name) or manifest["artifacts"].get(name)
+        if entry is None:
+            if name not in SUPPORT_ARTIFACTS:
+                logger.warning(f"⚠️ {path.name} is not listed in the manifest, refusing to load it")
+                return False
+            logger.warning(f"⚠️ {path.name} is not listed in the manifest, skipping checksum")
+            return True
+
+        if self._current_hash(path) != entry["sha256"]:
+            logger.warning(f"⚠️ Checksum mismatch for {path.name}, treating it as corrupted")
+            return False
+        return True
+
+    def fast_artifact(self, name: str) -> Optional[Path]:
+        """Path of name's fast-loading artifact if it can be trusted, else None.
+
+        It must be at least as new as the .pkl (so a retrained pickle never loads
+        an older model) and, with a manifest, listed there with a matching hash.
+        """
+        path = find_fast_artifact(self.models_dir, name)
+        pkl_path = self.models_dir / f"{name}.pkl"
+        if path is None:
+            return None
+        if pkl_path.exists() and path.stat().st_mtime_ns < pkl_path.stat().st_mtime_ns:
+            logger.warning(f"⚠️ {path.name} is older than {pkl_path.name}, ignoring it")
+            return None
+
+        manifest = self.load_manifest()
+        if manifest is None:
+            return path
+        listed = manifest["models"].get(name, {}).get("fast_artifact")
+        if listed is None or listed["file"] != path.name:
+            return None
+        if self._current_hash(path) != listed["sha256"]:
+            logger.warning(f"⚠️ Checksum mismatch for {path.name}, falling back to {pkl_path.name}")
+            return None
+        return path
+
+    def get_model_entry(self, model_name: str) -> Optional[Dict[str, Any]]:
+        manifest = self.load_manifest()
+        if manifest is None:
+            return None
+        return manifest["models"].get(model_name)
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        """Return manifest entries for every valid model on disk.
+
+        Without a manifest the .pkl files are listed as-is with empty metrics.
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            return [
+                {"name": path.stem, "file": path.name, "features": [], "metrics": {}}
+                for path in sorted(self.models_dir.glob("*.pkl"))
+                if path.stem not in SUPPORT_ARTIFACTS
+            ]
+
+        models = []
+        for name, entry in manifest["models"].items():
+            if self.verify(name):
+                models.append({"name": name, **entry})
+        return models
+
+
+def main():
+    """Rebuild models/manifest.json from the artifacts already on disk"""
+    logging.basicConfig(level=logging.INFO)
+    models_dir = Path("models")
+    model_info_path = models_dir / "model_info.pkl"
+
+    model_info = {}
+    if model_info_path.exists():
+        with open(model_info_path, "rb") as f:
+            model_info = pickle.load(f)
+
+    write_manifest(models_dir, model_info, model_info.get("model_metrics"))
+
+
+if __name__ == "__main__":
+    main()
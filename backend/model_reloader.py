@@ -0,0 +1,209 @@
+"""
+Zero-downtime model reloads.
+
+The live models are one RiskService and its ModelService: the models, scaler,
+model_info, feature plans and compiled evaluators of a single artifact set.
+A reload builds a complete new pair next to it, warms every model up,
+smoke-tests each feature plan's predict_proba and only then swaps the pointer.
+A request keeps the service it started with, so in-flight work finishes on the
+old models, which are freed once the last such request returns.
+
+The watcher polls models/ and reloads once a changed artifact set has stayed
+unchanged for a full interval, so a training run that is still writing files
+is never picked up half-way. Behind serve.py the workers do not watch: the
+supervisor reloads once and rolls the workers over, so they keep sharing one
+copy of the models.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from model_artifacts import FAST_SUFFIXES
+from metrics import count_error
+from model_registry import MANIFEST_NAME
+from services import ModelService, RiskService
+
+logger = logging.getLogger(__name__)
+
+
+class ModelReloadError(Exception):
+    """A candidate artifact set failed to load or validate"""
+
+
+class ModelReloader:
+    """Owns the live RiskService and replaces it when the artifacts change"""
+
+    def __init__(self, risk_service: RiskService, models_dir: Path = Path("models"),
+                 poll_interval: float = 0.0, on_swap: Optional[Callable[[RiskService], None]] = None):
+        self.risk_service = risk_service
+        self.models_dir = Path(models_dir)
+        self.poll_interval = poll_interval
+        # Called with the new service right after a swap (e.g. to repoint the inference pool)
+        self.on_swap = on_swap
+
+        self.version = None
+        self.loaded_signature = self.signature()
+        self._pending_signature = None
+        self._failed_signature = None
+        self._lock = threading.Lock()
+        self._task = None
+        # Set in serve.py workers: reloads are requested from the supervisor instead
+        self.supervisor_pid: Optional[int] = None
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_at = None
+
+    @property
+    def model_service(self) -> ModelService:
+        return self.risk_service.model_service
+
+    def signature(self) -> tuple:
+        """(name, size, mtime_ns) of every model artifact and the manifest"""
+        suffixes = (".pkl", *FAST_SUFFIXES)
+        files = []
+        for path in self.models_dir.glob("*"):
+            if path.suffix in suffixes or path.name == MANIFEST_NAME:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:  # Replaced while listing
+                    continue
+                files.append((path.name, stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(files))
+
+    def warm_up(self) -> List[str]:
+        """Warm the live service up and record which artifact set it serves"""
+        # Startup retries can overlap a watcher reload
+        with self._lock:
+            signature = self.signature()
+            warmed = self.risk_service.warm_up()
+            self.loaded_signature = signature
+            self.version = self.model_service.get_model_set_version()
+            logger.info(f"🏷️ Serving model set {self.version}")
+            return warmed
+
+    def build(self) -> RiskService:
+        """Load, warm up and smoke-test a new service from the files on disk"""
+        candidate = RiskService(ModelService())
+        warmed = candidate.warm_up()
+        available = candidate.model_service.get_available_models()
+        if not warmed:
+            raise ModelReloadError("no model could be loaded")
+        failed = sorted(set(available) - set(warmed))
+        if failed:
+            raise ModelReloadError(f"warm-up failed for {failed}")
+
+        # Score the calculator defaults through the path requests take
+        defaults = candidate.get_default_values()
+        for model_name in warmed:
+            plan = candidate.get_feature_plan(model_name)
+            probabilities = plan.predictor.predict_proba(plan.build_row(defaults))
+            if not np.all(np.isfinite(probabilities)) or probabilities.min() < 0 or probabilities.max() > 1:
+                raise ModelReloadError(f"{model_name} returned invalid probabilities {probabilities.tolist()}")
+        return candidate
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """Swap in the artifact set on disk if it changed (or force); blocking"""
+        with self._lock:
+            signature = self.signature()
+            if not force and signature == self.loaded_signature:
+                return {"status": "unchanged", "version": self.version}
+
+            started = time.perf_counter()
+            try:
+                candidate = self.build()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                # The watcher does not retry this exact file set
+                self._failed_signature = signature
+                count_error("model_reload", e)
+                logger.error(f"❌ Model reload failed, still serving {self.version}: {e}")
+                return {"status": "failed", "version": self.version, "error": str(e)}
+
+            # Result keys carry the model version, so unchanged models keep their cached scores
+            candidate.result_cache = self.risk_service.result_cache
+            previous = self.version
+            self.risk_service = candidate
+            self.version = candidate.model_service.get_model_set_version()
+            self.loaded_signature = signature
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_at = datetime.now().isoformat()
+            if self.on_swap is not None:
+                self.on_swap(candidate)
+
+            seconds = time.perf_counter() - started
+            logger.info(f"🔄 Swapped model set {previous} -> {self.version} ({seconds:.2f}s)")
+            return {
+                "status": "reloaded",
+                "version": self.version,
+                "previous_version": previous,
+                "models": self.model_versions(),
+                "seconds": round(seconds, 3),
+            }
+
+    def model_versions(self) -> Dict[str, str]:
+        """Version of every loaded model in the live set"""
+        return {
+            model_name: self.risk_service.model_version(model_name)
+            for model_name in list(self.model_service.loaded_models)
+        }
+
+    def poll(self) -> bool:
+        """One watcher tick: True once a changed artifact set has settled"""
+        signature = self.signature()
+        if signature in (self.loaded_signature, self._failed_signature):
+            self._pending_signature = None
+            return False
+        if signature != self._pending_signature:
+            # Changed since the last poll: wait until the files settle
+            self._pending_signature = signature
+            return False
+        self._pending_signature = None
+        logger.info("🔍 Model artifacts changed, reloading")
+        return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.poll():
+                continue
+            try:
+                await run_in_threadpool(self.reload)
+            except Exception as e:
+                logger.error(f"❌ Model reload crashed: {e}")
+
+    def start(self):
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.watch())
+            logger.info(f"👀 Watching {self.models_dir} for new models every {self.poll_interval}s")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "models": self.model_versions(),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_at": self.last_reload_at,
+            "poll_interval": self.poll_interval,
+        }
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -7,6 +7,11 @@ class SentimentAnalysisRequest(BaseModel):
     company_name: str
     
 
+class SentimentBatchRequest(BaseModel):
+    company_names: List[str] = Field(..., min_length=1)
+    max_concurrency: Optional[int] = Field(None, ge=1, le=50)
+    
+
 class SentimentAnalysisResponse(BaseModel):
     company_name: str
     sentiment_score: float
@@ -16,6 +21,26 @@ class SentimentAnalysisResponse(BaseModel):
     timestamp: datetime
 
 
+class SentimentHistoryResponse(BaseModel):
+    company_name: str
+    entries: List[SentimentAnalysisResponse]
+
+
+class SentimentTrendPoint(BaseModel):
+    period: str
+    analyses: int
+    average_sentiment: float
+    min_sentiment: float
+    max_sentiment: float
+
+
+class SentimentTrendResponse(BaseModel):
+    company_name: str
+    bucket: str
+    days: int
+    points: List[SentimentTrendPoint]
+
+
 class RiskCalculateRequest(BaseModel):
     feature_values: Dict[str, Any]
     model_name: Optional[str] = "xgboost_model"
@@ -24,8 +49,73 @@ class RiskCalculateRequest(BaseModel):
 class RiskCalculateResponse(BaseModel):
     risk_score: float
     risk_level: str
+    model_version: str  # Checksum prefix of the artifact that scored the request
     
 
+class EnsembleRequest(BaseModel):
+    feature_values: Dict[str, Any]
+    model_names: Optional[List[str]] = None  # Defaults to every available model; repeats count once
+    parallel: bool = False
+    weight_metric: str = "roc_auc"
+
+
+class EnsembleMember(BaseModel):
+    model_name: str
+    risk_score: float
+    risk_level: str
+    weight: float
+    model_version: str
+
+
+class EnsembleResponse(BaseModel):
+    risk_score: float
+    risk_level: str
+    weight_metric: str
+    model_version: str  # The members' versions combined
+    models: List[EnsembleMember]
+
+
+class CounterfactualRequest(BaseModel):
+    feature_values: Dict[str, Any]
+    model_name: Optional[str] = "xgboost_model"
+    target_risk: float = Field(0.3, gt=0, le=1)  # Default is the "low" threshold
+    max_changes: int = Field(3, ge=1, le=6)
+    budget: Optional[int] = Field(None, gt=0)
+    max_results: int = Field(5, ge=1, le=50)
+
+
+class CounterfactualChange(BaseModel):
+    name: str
+    from_value: float
+    to_value: float
+
+
+class Counterfactual(BaseModel):
+    changes: List[CounterfactualChange]
+    risk_score: float
+    risk_level: str
+    distance: float
+
+
+class CounterfactualResponse(BaseModel):
+    model_name: str
+    model_version: str
+    target_risk: float
+    base_risk_score: float
+    base_risk_level: str
+    counterfactuals: List[Counterfactual]
+    evaluated: int
+    budget: int
+
+
+class ModelReloadResponse(BaseModel):
+    status: str  # "reloaded", "unchanged", "failed", or "scheduled" behind serve.py
+    version: Optional[str]  # Artifact set served after the call
+    previous_version: Optional[str] = None
+    models: Dict[str, str] = {}
+    seconds: Optional[float] = None
+
+
 class RiskFeature(BaseModel):
     name: str
     display_name: str
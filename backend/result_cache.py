@@ -0,0 +1,179 @@
+"""
+Thread-safe LRU cache with optional TTL and hit/miss counters, plus an async
+single-flight variant for expensive upstream calls.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry first"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate; returns how many"""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class AsyncSingleFlightCache:
+    """Async TTL cache that coalesces concurrent misses into one computation.
+
+    Entries are fresh for ttl seconds. With a stale_ttl, an entry past its TTL
+    is still served for that much longer while one background refresh runs
+    (stale-while-revalidate).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0, stale_ttl: float = 0.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = LRUCache(max_size=max_size, ttl=ttl + stale_ttl)
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.computations = 0
+        self.errors = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.monotonic() < fresh_until:
+                self.hits += 1
+                return value
+            # Past its TTL but inside the stale window: serve it and refresh once
+            self.stale_hits += 1
+            self._start(key, compute)
+            return value
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        # Shielded so one caller going away does not cancel everyone's computation
+        return await asyncio.shield(self._start(key, compute))
+
+    def peek(self, key: Hashable) -> Any:
+        """Return a fresh cached value without computing anything, else None"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+        return None
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+        """Start computing key in the background (or join the running computation).
+
+        For callers that consume the computation's progress themselves, like a
+        streamed analysis; concurrent get_or_compute calls await the same task.
+        """
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        return self._start(key, compute)
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value computed outside get_or_compute"""
+        self._entries.set(key, (value, time.monotonic() + self.ttl))
+
+    def _start(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+        task = self._inflight.get(key)
+        if task is None:
+            self.computations += 1
+            task = asyncio.create_task(self._compute(key, compute))
+            # Background refreshes may have no awaiter; mark their errors as seen
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[key] = task
+        return task
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self._entries.max_size,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "computations": self.computations,
+            "errors": self.errors,
+            "hit_rate": (self.hits + self.stale_hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,92 @@
+"""
+Dynamic micro-batching for /api/risk/calculate.
+
+Concurrent requests for the same model are held for at most max_wait_ms (or
+until max_batch_size rows are waiting), scored with one vectorized
+predict_proba call on the inference executor and handed back individually. A
+row that fails to score only fails its own request.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class RiskBatcher:
+    """Collects single-row risk requests per model and scores them together"""
+
+    def __init__(self, executor, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        # model_name -> list of (feature_values, future, enqueued_at)
+        self._pending: Dict[str, List] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100])
+
+    async def submit(self, feature_values: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(model_name, [])
+        pending.append((feature_values, future, time.perf_counter()))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(model_name)
+        elif model_name not in self._timers:
+            self._timers[model_name] = loop.call_later(self.max_wait, self._flush, model_name)
+
+        return await future
+
+    def _flush(self, model_name: str):
+        timer = self._timers.pop(model_name, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model_name, [])
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._score(model_name, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, model_name: str, batch: List):
+        flushed_at = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            self.wait_ms.observe((flushed_at - enqueued_at) * 1000.0)
+
+        try:
+            results = await self.executor.run("score_batch", [item[0] for item in batch], model_name)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # score_batch hands back a row's own exception in place of its result
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        logger.debug(f"📦 Scored batch of {len(batch)} with {model_name}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "waiting": sum(len(batch) for batch in self._pending.values()),
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+        }
@@ -3,6 +3,7 @@
 Script to run the ML training pipeline
 """
 
+import argparse
 import sys
 import os
 from pathlib import Path
@@ -10,8 +11,33 @@ from pathlib import Path
 # Add the current directory to Python path
 sys.path.append(str(Path(__file__).parent))
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the risk models")
+    parser.add_argument(
+        "--models", nargs="+", metavar="MODEL",
+        help="Models to train (logistic_regression, decision_tree, random_forest, xgboost); default: all"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Models trained at once, one process each; 1 trains sequentially (default: one per core)"
+    )
+    parser.add_argument(
+        "--cores", type=int, default=None,
+        help="Cores shared between the models (default: all cores)"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Retrain even models whose data and config fingerprint is unchanged"
+    )
+    parser.add_argument(
+        "--tune", action="store_true",
+        help="Search hyperparameters with cross-validation first, then retrain models whose best config changed"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Run the ML training pipeline"""
+    args = parse_args(argv)
     print("🚀 Starting ML Training Pipeline")
     print("=" * 50)
     
@@ -20,7 +46,10 @@ def main():
         from train_ml_models import train_ml_models
         
         print("📊 Training ML models...")
-        model_info = train_ml_models()
+        model_info = train_ml_models(
+            models=args.models, workers=args.workers, total_cores=args.cores, force=args.force,
+            tune=args.tune
+        )
         
         print("\n🎉 Training completed successfully!")
         print("=" * 50)
@@ -39,6 +68,10 @@ def main():
         print("   pip install -r requirements.txt")
         return 1
         
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+        
     except FileNotFoundError as e:
         print(f"❌ File not found: {e}")
         print("💡 Make sure riskDBv4.csv is in the current directory")
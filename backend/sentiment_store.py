@@ -0,0 +1,211 @@
+"""
+SQLite-backed history of sentiment analyses.
+
+Results are queued by the request path and written by a background thread in
+batched transactions, so persistence never adds request latency. The database
+runs in WAL mode, letting trend and latest-N queries read while the writer
+commits. Rows are indexed on (company_key, analyzed_at).
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sentiment_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_key TEXT NOT NULL,
+    company_name TEXT NOT NULL,
+    sentiment_score REAL NOT NULL,
+    risk_level TEXT NOT NULL,
+    contributing_factors TEXT NOT NULL,
+    web_sources TEXT NOT NULL,
+    analyzed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sentiment_company_time
+    ON sentiment_history (company_key, analyzed_at);
+"""
+
+# SQLite strftime patterns for trend buckets
+BUCKETS = {
+    "hour": "%Y-%m-%dT%H:00:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+_STOP = object()
+
+
+def normalize_company(company_name: str) -> str:
+    """Storage key for a company: trimmed, case-folded, single-spaced"""
+    return " ".join(company_name.split()).casefold()
+
+
+class SentimentStore:
+    """Append-only sentiment history with a batched background writer"""
+
+    def __init__(self, path: str, batch_size: int = 100, flush_interval: float = 0.5,
+                 max_queue: int = 10000):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps NORMAL crash-safe; only the last commits can roll back on power loss
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread (the threadpool reuses its threads)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    def start(self):
+        if self._writer is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="sentiment-history-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"🗄️ Sentiment history store ready at {self.path}")
+
+    def close(self):
+        """Flush everything queued so far and stop the writer"""
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+    def record(self, result: Dict[str, Any]):
+        """Queue a SentimentAnalysisResponse-shaped dict for writing; never blocks"""
+        timestamp = result.get("timestamp") or datetime.now()
+        row = (
+            normalize_company(result["company_name"]),
+            result["company_name"],
+            float(result["sentiment_score"]),
+            result["risk_level"],
+            json.dumps(list(result.get("contributing_factors", []))),
+            json.dumps(list(result.get("web_sources", []))),
+            timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"⚠️ Sentiment history queue full, dropped {result['company_name']}")
+
+    def _write_loop(self):
+        connection = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Gather more rows until the batch is full or the flush interval passes
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [row for row in batch if row is not _STOP]
+                # Drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            if batch:
+                self._write(connection, batch)
+        connection.close()
+
+    def _write(self, connection: sqlite3.Connection, rows: List[tuple]):
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO sentiment_history (company_key, company_name, sentiment_score, risk_level, "
+                    "contributing_factors, web_sources, analyzed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+            self.written += len(rows)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.write_errors += 1
+            logger.error(f"❌ Failed to write {len(rows)} sentiment history rows: {e}")
+
+    def latest(self, company_name: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent analyses for a company, newest first"""
+        rows = self._reader().execute(
+            "SELECT company_name, sentiment_score, risk_level, contributing_factors, web_sources, analyzed_at "
+            "FROM sentiment_history WHERE company_key = ? ORDER BY analyzed_at DESC LIMIT ?",
+            (normalize_company(company_name), limit)
+        ).fetchall()
+        return [
+            {
+                "company_name": row["company_name"],
+                "sentiment_score": row["sentiment_score"],
+                "risk_level": row["risk_level"],
+                "contributing_factors": json.loads(row["contributing_factors"]),
+                "web_sources": json.loads(row["web_sources"]),
+                "timestamp": row["analyzed_at"],
+            }
+            for row in rows
+        ]
+
+    def trend(self, company_name: str, days: int = 30, bucket: str = "day") -> List[Dict[str, Any]]:
+        """Per-bucket average, min and max sentiment over the last `days` days, oldest first"""
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {sorted(BUCKETS)}")
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        rows = self._reader().execute(
+            "SELECT strftime(?, analyzed_at) AS period, COUNT(*) AS analyses, "
+            "AVG(sentiment_score) AS average, MIN(sentiment_score) AS minimum, MAX(sentiment_score) AS maximum "
+            "FROM sentiment_history WHERE company_key = ? AND analyzed_at >= ? "
+            "GROUP BY period ORDER BY period",
+            (BUCKETS[bucket], normalize_company(company_name), since)
+        ).fetchall()
+        return [
+            {
+                "period": row["period"],
+                "analyses": row["analyses"],
+                "average_sentiment": row["average"],
+                "min_sentiment": row["minimum"],
+                "max_sentiment": row["maximum"],
+            }
+            for row in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
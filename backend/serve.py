@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Pre-fork multi-process server for the API.
+
+The supervisor imports the app and warms every model up (unpickling, feature
+plans, compiled tree evaluators) once, freezes the garbage collector so those
+objects are never written to again, binds the listening socket and then forks
+the workers. Each worker runs its own uvicorn event loop on the shared socket
+and starts out sharing the loaded models with the supervisor and every other
+worker, copy-on-write, instead of unpickling its own copy.
+
+A worker reports ready through a pipe once its lifespan (which re-checks every
+model in-process) has finished. Workers that exit are replaced; with
+SERVE_MAX_REQUESTS set, each one drains and exits after that many requests
+(plus jitter, so they do not all recycle at once). SIGHUP replaces the
+workers one at a time, each retired only after its replacement is ready.
+SIGTERM/SIGINT drain every worker and exit.
+
+Model reloads are coordinated here rather than in each worker, which would
+otherwise build a private copy of the new set. The supervisor watches models/
+(every MODEL_RELOAD_INTERVAL seconds) and also re-checks it on SIGHUP. It loads
+and validates a changed set once, then rolls the workers over so the new ones
+are forked sharing it. A set that fails validation leaves the workers alone.
+
+Workers write their metrics to a shared directory (METRICS_DIR, else a
+temporary one) so /metrics reports every worker; the supervisor archives the
+counters of each worker that exits.
+
+Usage: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+
+import argparse
+import errno
+import gc
+import logging
+import math
+import os
+import random
+import select
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from config import settings
+from metrics import SharedMetricsDir
+
+logger = logging.getLogger("serve")
+
+# Seconds a crashed worker's replacement waits, doubling up to the max
+RESPAWN_BACKOFF = 1.0
+RESPAWN_BACKOFF_MAX = 30.0
+
+
+def _single_threaded_openmp():
+    # libgomp's thread pool does not survive fork: a child whose parent ran
+    # a multi-threaded OpenMP region (XGBoost) hangs on its next one
+    from threadpoolctl import threadpool_limits
+    return threadpool_limits(limits=1, user_api="openmp")
+
+
+def _freeze_heap():
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers never touch (and copy) the shared pages
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def preload():
+    """Import the app and load every model before forking; returns (app, model_reloader)"""
+    import main
+
+    if settings.warm_up_models:
+        with _single_threaded_openmp():
+            main.model_reloader.warm_up()
+    _freeze_heap()
+    return main.app, main.model_reloader
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """CPUs the container may use per the cgroup CFS quota, or None if unlimited"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: a quota of -1 means unlimited
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually run on: its affinity mask capped by the cgroup quota.
+
+    os.cpu_count() reports the host's cores, far more than a container's quota.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not on Linux
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn server that tells the supervisor when its lifespan has finished"""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started:
+            import main
+            status = "ready" if main.model_reloader.model_service.ready else "not-ready"
+            # Lines shorter than PIPE_BUF are written atomically
+            os.write(self.ready_fd, f"{os.getpid()} {status}\n".encode())
+
+
+class Worker:
+    def __init__(self, pid: int, max_requests: Optional[int]):
+        self.pid = pid
+        self.max_requests = max_requests
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.retiring = False
+
+
+class Supervisor:
+    """Forks, watches and replaces the uvicorn workers"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, max_requests: int = 0,
+                 max_requests_jitter: int = 0, graceful_timeout: float = 30.0, reloader=None,
+                 shared_metrics: Optional[SharedMetricsDir] = None):
+        self.app = app
+        # main.model_reloader; the workers inherit whatever set it serves at fork time
+        self.reloader = reloader
+        self.shared_metrics = shared_metrics
+        self.sock = sock
+        self.num_workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        self.workers: Dict[int, Worker] = {}
+        self.stopping = False
+        self.rolling: list = []  # pids still to replace in a SIGHUP restart
+        self.replacing: Optional[tuple] = None  # (new pid, old pid) of the restart in progress
+        self.backoff = 0.0
+        self.next_spawn_at = 0.0
+        self.reload_requested = False
+        self.next_poll_at = 0.0
+
+        self.ready_r, self.ready_w = os.pipe()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_w, False)
+        self._buffer = b""
+
+    # -- workers ---------------------------------------------------------
+
+    def spawn(self) -> int:
+        max_requests = None
+        if self.max_requests > 0:
+            max_requests = self.max_requests + random.randint(0, self.max_requests_jitter)
+
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(max_requests)
+            except BaseException:
+                logger.exception(f"❌ Worker {os.getpid()} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.workers[pid] = Worker(pid, max_requests)
+        logger.info(f"👷 Started worker {pid}" + (f" (recycles after {max_requests} requests)" if max_requests else ""))
+        return pid
+
+    def _run_worker(self, max_requests: Optional[int]):
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        # Rolling restarts are the supervisor's job
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for fd in (self.ready_r, self.wake_r, self.wake_w):
+            os.close(fd)
+        if self.reloader is not None:
+            # The supervisor watches models/; the admin endpoint asks it to reload
+            self.reloader.poll_interval = 0
+            self.reloader.supervisor_pid = os.getppid()
+
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            limit_max_requests=max_requests,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        _WorkerServer(config, self.ready_w).run(sockets=[self.sock])
+
+    def signal_worker(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if self.shared_metrics is not None:
+                # Its counters stay in the totals after it is gone
+                self.shared_metrics.archive(pid)
+
+            code = os.waitstatus_to_exitcode(status)
+            if worker.retiring or self.stopping:
+                logger.info(f"👋 Worker {pid} exited ({code})")
+            elif worker.ready and code == 0:
+                logger.info(f"♻️ Worker {pid} recycled after {worker.max_requests} requests")
+            else:
+                logger.error(f"❌ Worker {pid} died ({code})" + ("" if worker.ready else " before becoming ready"))
+
+            if not worker.ready and not self.stopping:
+                # Crash loop: back off instead of forking as fast as workers die
+                self.backoff = min(RESPAWN_BACKOFF_MAX, (self.backoff * 2) or RESPAWN_BACKOFF)
+                self.next_spawn_at = time.monotonic() + self.backoff
+            if self.replacing and pid == self.replacing[0]:
+                # The replacement never came up: keep the old worker serving
+                logger.error(f"❌ Rolling restart aborted, keeping worker {self.replacing[1]}")
+                old = self.workers.get(self.replacing[1])
+                if old is not None:
+                    old.retiring = False
+                self.replacing = None
+                self.rolling = []
+
+    def read_ready(self):
+        self._buffer += os.read(self.ready_r, 4096)
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            pid_text, status = line.decode().split()
+            worker = self.workers.get(int(pid_text))
+            if worker is None:
+                continue
+            worker.ready = True
+            self.backoff = 0.0
+            ready = sum(1 for w in self.workers.values() if w.ready and not w.retiring)
+            if status == "ready":
+                logger.info(f"✅ Worker {worker.pid} ready ({ready}/{self.num_workers})")
+            else:
+                logger.warning(f"⚠️ Worker {worker.pid} is serving but its models failed to warm up")
+
+            if self.replacing and worker.pid == self.replacing[0]:
+                logger.info(f"🔁 Retiring worker {self.replacing[1]}")
+                self.signal_worker(self.replacing[1], signal.SIGTERM)
+                self.replacing = None
+
+    def maintain(self):
+        """Start a rolling-restart step, or replace workers that are gone"""
+        if self.stopping or time.monotonic() < self.next_spawn_at:
+            return
+        if self.rolling and self.replacing is None:
+            old_pid = self.rolling.pop(0)
+            old = self.workers.get(old_pid)
+            if old is not None and not old.retiring:
+                old.retiring = True
+                self.replacing = (self.spawn(), old_pid)
+            return
+        active = sum(1 for worker in self.workers.values() if not worker.retiring)
+        for _ in range(self.num_workers - active):
+            self.spawn()
+
+    def start_rolling_restart(self):
+        logger.info("🔁 Replacing workers one at a time")
+        self.rolling = [pid for pid, worker in self.workers.items() if not worker.retiring]
+
+    # -- models ----------------------------------------------------------
+
+    def reload_models(self) -> bool:
+        """Load, validate and swap in the artifact set on disk; True if it changed"""
+        with _single_threaded_openmp():
+            result = self.reloader.reload()
+        if result["status"] != "reloaded":
+            return False
+        _freeze_heap()
+        return True
+
+    def check_models(self):
+        """Reload on SIGHUP or once the watched artifacts settle, then roll the workers over"""
+        if self.stopping:
+            return
+        requested, self.reload_requested = self.reload_requested, False
+        changed = False
+        if self.reloader is not None and self.reloader.poll_interval > 0 and time.monotonic() >= self.next_poll_at:
+            self.next_poll_at = time.monotonic() + self.reloader.poll_interval
+            changed = self.reloader.poll()
+        if not (requested or changed):
+            return
+        # Blocks the loop for the load; workers keep serving meanwhile
+        reloaded = self.reloader is not None and self.reload_models()
+        if requested or reloaded:
+            self.start_rolling_restart()
+
+    # -- signals ---------------------------------------------------------
+
+    def _on_signal(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP and not self.stopping:
+            logger.info("🔁 SIGHUP: reloading models if they changed, then replacing workers")
+            # Handled by the main loop, not inside the signal handler
+            self.reload_requested = True
+
+    def install_signals(self):
+        signal.set_wakeup_fd(self.wake_w)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+
+    # -- main loop -------------------------------------------------------
+
+    def run(self):
+        self.install_signals()
+        logger.info(f"🚀 Supervisor {os.getpid()} serving on {self.sock.getsockname()[:2]} with {self.num_workers} workers")
+        self.maintain()
+        while not self.stopping:
+            try:
+                readable, _, _ = select.select([self.ready_r, self.wake_r], [], [], 1.0)
+            except InterruptedError:
+                readable = []
+            if self.wake_r in readable:
+                os.read(self.wake_r, 4096)
+            if self.ready_r in readable:
+                self.read_ready()
+            self.reap()
+            self.check_models()
+            self.maintain()
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info(f"🛑 Draining {len(self.workers)} workers")
+        for pid in list(self.workers):
+            self.signal_worker(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning(f"⚠️ Worker {pid} did not exit in time, killing it")
+            self.signal_worker(pid, signal.SIGKILL)
+        while self.workers:
+            try:
+                os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.reap()
+        self.sock.close()
+        logger.info("👋 Supervisor stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing preloaded models")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.serve_workers,
+                        help="Worker processes (default: SERVE_WORKERS, else one per CPU the container may use)")
+    parser.add_argument("--max-requests", type=int, default=settings.serve_max_requests,
+                        help="Recycle a worker after this many requests (0 never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.serve_max_requests_jitter)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.serve_graceful_timeout)
+    args = parser.parse_args()
+
+    # Before main is imported, which sets up the workers' metrics from it
+    temporary_metrics_dir = None
+    if not settings.metrics_dir:
+        settings.metrics_dir = temporary_metrics_dir = tempfile.mkdtemp(prefix="serve-metrics-")
+    shared_metrics = SharedMetricsDir(settings.metrics_dir)
+    shared_metrics.reset()
+
+    try:
+        app, reloader = preload()
+        try:
+            sock = bind_socket(args.host, args.port)
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                raise SystemExit(f"Port {args.port} is already in use")
+            raise
+
+        Supervisor(
+            app,
+            sock,
+            workers=args.workers or available_cpus(),
+            max_requests=args.max_requests,
+            max_requests_jitter=args.max_requests_jitter,
+            graceful_timeout=args.graceful_timeout,
+            reloader=reloader,
+            shared_metrics=shared_metrics,
+        ).run()
+    finally:
+        if temporary_metrics_dir is not None:
+            shutil.rmtree(temporary_metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,63 @@
 import joblib
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple, AsyncIterator, Union
 import httpx
 import openai
 from pathlib import Path
+import hashlib
 import json
 import logging
+import asyncio
 from datetime import datetime
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from config import settings
+from model_registry import ModelRegistry
+from model_artifacts import load_fast_artifact
+from model_cache import ModelCache, MISSING
+from feature_plan import FeaturePlan
+from result_cache import LRUCache, AsyncSingleFlightCache
+from counterfactuals import search_counterfactuals
+from tree_engine import compile_and_verify
+from rate_limit import AsyncRateLimiter
+from context_builder import ContextBuilder, estimate_prompt_tokens
+from metrics import STAGE_SECONDS, FALLBACKS, time_upstream
 
 logger = logging.getLogger(__name__)
 
+# Hex digits of an artifact's sha256 reported as its model_version
+MODEL_VERSION_LENGTH = 12
+# Model cache key of the shared feature scaler
+SCALER_NAME = "scaler"
+
+
+def combine_versions(versions: Dict[str, str]) -> str:
+    """One short version naming a set of model versions"""
+    digest = hashlib.sha256()
+    for model_name in sorted(versions):
+        digest.update(f"{model_name}:{versions[model_name]}\n".encode())
+    return digest.hexdigest()[:MODEL_VERSION_LENGTH]
+
 
 class ModelService:
     def __init__(self):
         self.models_dir = Path("models")
-        self.loaded_models = {}
-        self.loaded_scalers = {}
+        self.registry = ModelRegistry(self.models_dir)
+        # Models and the scaler, evicted least-recently-used beyond the memory budget
+        self.model_cache = ModelCache(
+            int(settings.model_cache_max_mb * 2**20) if settings.model_cache_max_mb else None,
+            pinned=(SCALER_NAME,)
+        )
+        self.model_versions = {}
+        self.scaler_version = None
         self.model_info = None
+        self.ready = False
+        # Serializes unpickling when several inference threads miss the cache at once
+        self._load_lock = threading.RLock()
         
     def load_model_info(self):
         """Load model information and feature lists"""
@@ -84,42 +121,111 @@ class ModelService:
                 }
         return self.model_info
         
+    @property
+    def loaded_models(self) -> Dict[str, Any]:
+        """Models resident in the cache right now"""
+        return {name: value for name, value in self.model_cache.items().items() if name != SCALER_NAME}
+        
     def load_scaler(self):
         """Load the scaler for feature preprocessing"""
-        if 'scaler' not in self.loaded_scalers:
+        scaler = self.model_cache.get(SCALER_NAME)
+        if scaler is not MISSING:
+            return scaler
+        
+        with self._load_lock:
+            scaler = self.model_cache.peek(SCALER_NAME)
+            if scaler is not MISSING:
+                return scaler
+            started = time.perf_counter()
             scaler_path = self.models_dir / "scaler.pkl"
+            # Set beforehand only when pinned to a validated set (process inference workers)
+            pinned = self.scaler_version
+            if pinned and (not scaler_path.exists() or self.registry.file_hash(SCALER_NAME) != pinned):
+                logger.error("❌ scaler.pkl changed since this model set was validated, not loading it")
+                raise FileNotFoundError("scaler.pkl changed on disk; it is served again after the next model reload")
             if scaler_path.exists():
                 with open(scaler_path, 'rb') as f:
-                    self.loaded_scalers['scaler'] = pickle.load(f)
+                    scaler = pickle.load(f)
+                self.scaler_version = self.registry.file_hash(SCALER_NAME)
                 logger.info("✅ Loaded scaler")
             else:
                 logger.warning("⚠️ Scaler not found, will use unscaled features")
-                self.loaded_scalers['scaler'] = None
-        return self.loaded_scalers['scaler']
+                scaler = None
+                self.scaler_version = ""
+            self.model_cache.put(SCALER_NAME, scaler, time.perf_counter() - started)
+            return scaler
         
     def load_model(self, model_name: str):
         """Load model from .pkl file"""
-        if model_name in self.loaded_models:
-            return self.loaded_models[model_name]
+        model = self.model_cache.get(model_name)
+        if model is not MISSING:
+            return model
+        
+        with self._load_lock:
+            model = self.model_cache.peek(model_name)
+            if model is not MISSING:
+                return model
+            started = time.perf_counter()
+            model = self._load_model_file(model_name)
+            self.model_cache.put(model_name, model, time.perf_counter() - started)
+            return model
             
+    def _load_model_file(self, model_name: str):
         model_path = self.models_dir / f"{model_name}.pkl"
         if not model_path.exists():
             raise FileNotFoundError(f"Model {model_name}.pkl not found in models directory")
+        if not self.registry.verify(model_name):
+            raise FileNotFoundError(f"Model {model_name}.pkl is not listed in the manifest or does not match its checksum")
+        pinned = self.model_versions.get(model_name)
+        if pinned is not None and self.registry.file_hash(model_name) != pinned:
+            # Evicted and since replaced on disk: loading it would mix artifact sets
+            logger.error(f"❌ {model_name}.pkl changed since this model set was validated, not reloading it")
+            raise FileNotFoundError(f"Model {model_name}.pkl changed on disk; it is served again after the next model reload")
+            
+        # Memory-mapped joblib / native XGBoost artifact when training wrote one
+        fast_path = self.registry.fast_artifact(model_name)
+        if fast_path is not None:
+            try:
+                model = load_fast_artifact(fast_path)
+                self.model_versions[model_name] = self.registry.file_hash(model_name)
+                logger.info(f"✅ Loaded model: {model_name} from {fast_path}")
+                return model
+            except Exception as e:
+                logger.warning(f"⚠️ Could not load {fast_path.name} ({e}), falling back to {model_path.name}")
+                FALLBACKS.inc(model=model_name, kind="pickle_load")
             
         try:
             with open(model_path, 'rb') as f:
                 model = pickle.load(f)
-            self.loaded_models[model_name] = model
+            self.model_versions[model_name] = self.registry.file_hash(model_name)
             logger.info(f"✅ Loaded model: {model_name} from {model_path}")
             return model
         except (pickle.UnpicklingError, EOFError, ValueError) as e:
             logger.error(f"❌ Corrupted model file: {model_name}.pkl - {e}")
             raise FileNotFoundError(f"Model {model_name}.pkl is corrupted and cannot be loaded")
         
-    def preprocess_data(self, df: pd.DataFrame, model_name: str = None) -> pd.DataFrame:
-        """Preprocess data according to the model requirements"""
+    def get_model_version(self, model_name: str) -> str:
+        """Checksum of the artifact the loaded model came from (or last came from, if evicted)"""
+        if model_name not in self.model_versions:
+            self.load_model(model_name)
+        return self.model_versions[model_name]
+        
+    def get_scaler_version(self) -> str:
+        """Checksum of the loaded scaler.pkl, empty when there is none"""
+        if self.scaler_version is None:
+            self.load_scaler()
+        return self.scaler_version
+        
+    def get_model_set_version(self) -> str:
+        """Version of the whole artifact set: every available model's checksum combined"""
+        return combine_versions({
+            model_name: self.get_model_version(model_name)
+            for model_name in self.get_available_models()
+        })
+        
+    def get_feature_order(self, model_name: str = None) -> List[str]:
+        """Resolve the column order the model was fitted with"""
         model_info = self.load_model_info()
-        scaler = self.load_scaler()
         
         # Try to load the model to get the correct feature order
         try:
@@ -145,6 +251,15 @@ class ModelService:
             logger.warning(f"⚠️ Could not load model to get features: {e}")
             predictors = model_info.get('predictors', [])
         
+        return list(predictors)
+        
+    def preprocess_data(self, df: pd.DataFrame, model_name: str = None) -> pd.DataFrame:
+        """Preprocess data according to the model requirements"""
+        model_info = self.load_model_info()
+        scaler = self.load_scaler()
+        
+        predictors = self.get_feature_order(model_name)
+        
         scale_features = model_info.get('scale_features', [])
         leave_unscaled = model_info.get('leave_unscaled', [])
         
@@ -166,20 +281,23 @@ class ModelService:
         
         # Select only the required predictors IN THE EXACT ORDER
         # This is critical for model compatibility
-        df_subset = df[predictors].copy()
-        
-        # Handle missing values
-        df_subset = df_subset.fillna(0)
+        with STAGE_SECONDS.time(stage="feature_assembly", model=model_name or ""):
+            df_subset = df[predictors].copy()
+            
+            # Handle missing values
+            df_subset = df_subset.fillna(0)
         
         # Scale features if scaler is available
         if scaler is not None and scale_features:
             try:
                 # Scale the features that need scaling
-                scaled_features = scaler.transform(df_subset[scale_features])
-                df_subset[scale_features] = scaled_features
+                with STAGE_SECONDS.time(stage="scaling", model=model_name or ""):
+                    scaled_features = scaler.transform(df_subset[scale_features])
+                    df_subset[scale_features] = scaled_features
                 logger.info(f"✅ Scaled {len(scale_features)} features")
             except Exception as e:
                 logger.error(f"❌ Error scaling features: {e}")
+                FALLBACKS.inc(model=model_name or "", kind="unscaled")
                 # Continue without scaling
         else:
             logger.info("ℹ️ No scaler available, using unscaled features")
@@ -200,7 +318,8 @@ class ModelService:
         
         # Make predictions
         try:
-            predictions = model.predict(processed_df)
+            with STAGE_SECONDS.time(stage="predict", model=model_name):
+                predictions = model.predict(processed_df)
             logger.info(f"📊 Made {len(predictions)} predictions with {model_name}")
             logger.info(f"📊 Sample predictions (first 5): {predictions[:5]}")
             logger.info(f"📊 Prediction range: [{predictions.min():.2f}, {predictions.max():.2f}]")
@@ -221,29 +340,76 @@ class ModelService:
         
         return predictions
         
+    def predict_risk(self, model_name: str, df: pd.DataFrame) -> np.ndarray:
+        """Return the failure probability (class 1) for every row of the dataframe"""
+        model = self.load_model(model_name)
+        processed_df = self.preprocess_data(df, model_name)
+        
+        if hasattr(model, 'predict_proba'):
+            with STAGE_SECONDS.time(stage="predict_proba", model=model_name):
+                probabilities = model.predict_proba(processed_df)
+            # Get probability of failure (class 1)
+            return probabilities[:, 1] if probabilities.shape[1] > 1 else probabilities[:, 0]
+        
+        # Fallback to binary prediction
+        with STAGE_SECONDS.time(stage="predict", model=model_name):
+            return model.predict(processed_df).astype(float)
+        
+    def warm_up(self, sample_df: pd.DataFrame) -> List[str]:
+        """Load model info, the scaler and every model, then score a dummy row with each.
+        
+        Runs once at startup so the first real request never pays for unpickling
+        or for the models' first-call allocations. Marks the service ready only once
+        every listed model has loaded and scored the dummy row.
+        """
+        self.load_model_info()
+        self.load_scaler()
+        
+        available = self.get_available_models()
+        warmed = []
+        for model_name in available:
+            try:
+                self.predict_risk(model_name, sample_df)
+                warmed.append(model_name)
+            except Exception as e:
+                logger.error(f"❌ Warm-up failed for {model_name}: {e}")
+        
+        self.ready = bool(warmed) and len(warmed) == len(available)
+        if self.ready:
+            logger.info(f"🔥 Warmed up {len(warmed)} models: {warmed}")
+        else:
+            logger.error(f"❌ Warmed up {len(warmed)} of {len(available)} models, not ready to serve")
+        return warmed
+        
     def get_available_models(self) -> List[str]:
         """Get list of available models (excluding corrupted ones)"""
-        available_models = []
-        for model_file in self.models_dir.glob("*.pkl"):
-            if not model_file.name.startswith("scaler") and not model_file.name.startswith("model_info"):
-                model_name = model_file.stem
-                
-                # Test if model can be loaded
-                try:
-                    with open(model_file, 'rb') as f:
-                        pickle.load(f)
-                    available_models.append(model_name)
-                    logger.info(f"✅ Verified model: {model_name}")
-                except (pickle.UnpicklingError, EOFError, ValueError) as e:
-                    logger.warning(f"⚠️ Skipping corrupted model: {model_name} - {e}")
-                    continue
-                    
-        return available_models
+        return [model["name"] for model in self.registry.list_models()]
         
+    def get_model_catalog(self) -> List[Dict[str, Any]]:
+        """Get manifest entries (features, metrics, checksum) for every valid model"""
+        return self.registry.list_models()
+        
+
+ENSEMBLE_MODEL_NAME = "ensemble"
+
 
 class RiskService:
-    def __init__(self):
-        self.model_service = ModelService()
+    def __init__(self, model_service: ModelService = None):
+        # Share the caller's ModelService so models are only unpickled once per worker
+        self.model_service = model_service or ModelService()
+        self._default_values = None
+        self._feature_steps = None
+        self.feature_plans = {}
+        self.result_cache = LRUCache(
+            max_size=settings.risk_cache_size,
+            ttl=settings.risk_cache_ttl
+        ) if settings.risk_cache_enabled else None
+        self._ensemble_pool = None
+        # A plan holds its model, so an evicted model's plan has to go too
+        self.model_service.model_cache.eviction_listeners.append(self._drop_feature_plan)
+        
+    def _drop_feature_plan(self, model_name: str):
+        self.feature_plans.pop(model_name, None)
         
     def get_feature_definitions(self) -> List[Dict[str, Any]]:
         """Get feature definitions for the risk calculator"""
@@ -434,125 +600,702 @@ class RiskService:
     
     def get_default_values(self) -> Dict[str, Any]:
         """Get default values for all features"""
-        features = self.get_feature_definitions()
-        defaults = {}
-        for feature in features:
-            defaults[feature["name"]] = feature["default_value"]
+        if self._default_values is None:
+            features = self.get_feature_definitions()
+            defaults = {}
+            for feature in features:
+                defaults[feature["name"]] = feature["default_value"]
+            self._default_values = defaults
         
-        return defaults
+        return dict(self._default_values)
     
-    def calculate_risk(self, feature_values: Dict[str, Any], model_name: str = "xgboost_model") -> Dict[str, Any]:
-        """Calculate risk score from feature values"""
+    def get_feature_plan(self, model_name: str) -> FeaturePlan:
+        """Get the precompiled feature plan for a model, rebuilding it if the model was reloaded"""
+        model = self.model_service.load_model(model_name)
+        plan = self.feature_plans.get(model_name)
+        if plan is None or plan.model is not model:
+            model_info = self.model_service.load_model_info()
+            plan = FeaturePlan(
+                model,
+                self.model_service.get_feature_order(model_name),
+                self.get_default_values(),
+                model_info.get('scale_features', []),
+                self.model_service.load_scaler()
+            )
+            if settings.tree_engine_enabled:
+                compiled = compile_and_verify(plan.predictor, plan.n_features, settings.tree_engine_max_rows)
+                if compiled is not None:
+                    plan.predictor = compiled
+                    # The flattened trees are resident on top of the model and live as long as it does
+                    self.model_service.model_cache.charge(model_name, compiled.nbytes)
+            # Evicted while the plan was being built: use it for this call only
+            if model_name in self.model_service.model_cache:
+                self.feature_plans[model_name] = plan
+            logger.info(f"🧩 Compiled feature plan for {model_name}: {plan.n_features} features")
+        return plan
+    
+    def model_version(self, model_name: str) -> str:
+        """Short checksum of the artifact model_name is served from"""
+        return self.model_service.get_model_version(model_name)[:MODEL_VERSION_LENGTH]
+    
+    def warm_up(self) -> List[str]:
+        """Warm every model up with the calculator's default feature values"""
+        warmed = self.model_service.warm_up(self._to_frame({}))
+        for model_name in warmed:
+            self.get_feature_plan(model_name)
+        return warmed
+    
+    def quantize_features(self, feature_values: Dict[str, Any]) -> Tuple[tuple, Dict[str, Any]]:
+        """Snap every feature onto its slider step.
         
-        # Get default values and update with provided values
-        full_features = self.get_default_values()
-        full_features.update(feature_values)
+        Returns the integer grid coordinates (a cache key) and the snapped values
+        that get scored, so a cached result is exact for every input sharing its key.
+        Switches use a step of 1.
+        """
+        if self._feature_steps is None:
+            self._feature_steps = [
+                (feature["name"], feature.get("step") or 1)
+                for feature in self.get_feature_definitions()
+            ]
+        defaults = self._default_values or self.get_default_values()
         
-        # Convert boolean values to integers
-        for key, value in full_features.items():
-            if isinstance(value, bool):
-                full_features[key] = int(value)
+        grid = []
+        snapped = {}
+        for name, step in self._feature_steps:
+            value = feature_values.get(name)
+            if value is None:
+                value = defaults[name]
+            position = int(round(float(value) / step))
+            grid.append(position)
+            snapped[name] = position * step
+        return tuple(grid), snapped
+    
+    def _cache_key(self, feature_values: Dict[str, Any], model_name: str) -> Tuple[tuple, Dict[str, Any]]:
+        # Hashes of the model and scaler actually loaded, so a reloaded artifact
+        # gets fresh keys and old entries age out of the LRU
+        grid, snapped = self.quantize_features(feature_values)
+        version = (self.model_service.get_model_version(model_name), self.model_service.get_scaler_version())
+        return (model_name, version, grid), snapped
+    
+    def calculate_risk(self, feature_values: Dict[str, Any], model_name: str = "xgboost_model") -> Dict[str, Any]:
+        """Calculate risk score from feature values, answering repeats from the result cache"""
+        if model_name == ENSEMBLE_MODEL_NAME:
+            return self.calculate_ensemble(feature_values)
+        if self.result_cache is None:
+            return self._calculate_risk(feature_values, model_name)
         
-        # Create DataFrame
-        df = pd.DataFrame([full_features])
+        key, snapped = self._cache_key(feature_values, model_name)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self._calculate_risk(snapped, model_name)
+            self.result_cache.set(key, result)
+        return dict(result)
+    
+    @staticmethod
+    def _stage_timer(model_name: str):
+        """stage -> context manager recording into risk_stage_duration_seconds"""
+        return lambda stage: STAGE_SECONDS.time(stage=stage, model=model_name)
+    
+    def _model_label(self, model_name: str) -> str:
+        # Only names that loaded become label values, so bad requests can't grow the series
+        return model_name if model_name in self.model_service.model_versions else "unknown"
+    
+    def _calculate_risk(self, feature_values: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        """Score one feature dict with the model"""
         
         # Get probability prediction instead of binary prediction
         try:
-            model = self.model_service.load_model(model_name)
-            processed_df = self.model_service.preprocess_data(df, model_name)
+            # Fast path: map the request straight into a preallocated scaled row
+            plan = self.get_feature_plan(model_name)
+            model = plan.predictor
+            row = plan.build_row(feature_values, self._stage_timer(model_name))
             
             # Use predict_proba if available (for probability scores)
             if hasattr(model, 'predict_proba'):
-                probabilities = model.predict_proba(processed_df)
+                with STAGE_SECONDS.time(stage="predict_proba", model=model_name):
+                    probabilities = model.predict_proba(row)
                 # Get probability of failure (class 1)
                 risk_score = float(probabilities[0][1]) if probabilities.shape[1] > 1 else float(probabilities[0][0])
-                logger.info(f"📊 Probability prediction: {probabilities[0]} -> Risk score: {risk_score:.4f}")
+                logger.debug(f"📊 Probability prediction: {probabilities[0]} -> Risk score: {risk_score:.4f}")
             else:
                 # Fallback to binary prediction
-                predictions = model.predict(processed_df)
+                with STAGE_SECONDS.time(stage="predict", model=model_name):
+                    predictions = model.predict(row)
                 risk_score = float(predictions[0])
-                logger.info(f"📊 Binary prediction: {risk_score}")
+                logger.debug(f"📊 Binary prediction: {risk_score}")
                 
         except Exception as e:
             logger.error(f"❌ Error getting probability prediction: {e}")
+            FALLBACKS.inc(model=self._model_label(model_name), kind="predict")
             # Fallback to original method
-            predictions = self.model_service.predict(model_name, df)
+            predictions = self.model_service.predict(model_name, self._to_frame(feature_values))
             risk_score = float(predictions[0])
         
-        # Determine risk level based on probability
-        if risk_score < 0.3:
-            risk_level = "low"
-        elif risk_score < 0.7:
-            risk_level = "medium"
+        return {
+            "risk_score": risk_score,
+            "risk_level": self.get_risk_level(risk_score),
+            "model_version": self.model_version(model_name)
+        }
+    
+    def score_batch(self, rows: List[Dict[str, Any]],
+                    model_name: str = "xgboost_model") -> List[Union[Dict[str, Any], Exception]]:
+        """Score several feature dicts against one model with a single predict_proba call.
+        
+        Returns one entry per row: its result, or the exception that row raised,
+        so a malformed request only fails itself and not the rest of its batch.
+        """
+        if model_name == ENSEMBLE_MODEL_NAME:
+            results = []
+            for feature_values in rows:
+                try:
+                    results.append(self.calculate_ensemble(feature_values))
+                except Exception as e:
+                    results.append(e)
+            return results
+        if self.result_cache is None:
+            return self._score_batch(rows, model_name)
+        
+        results = [None] * len(rows)
+        misses = []
+        for i, feature_values in enumerate(rows):
+            try:
+                key, snapped = self._cache_key(feature_values, model_name)
+            except (TypeError, ValueError) as e:
+                results[i] = e
+                continue
+            cached = self.result_cache.get(key)
+            if cached is None:
+                misses.append((i, key, snapped))
+            else:
+                results[i] = dict(cached)
+        
+        if misses:
+            scored = self._score_batch([snapped for _, _, snapped in misses], model_name)
+            for (i, key, _), result in zip(misses, scored):
+                if not isinstance(result, Exception):
+                    self.result_cache.set(key, result)
+                    result = dict(result)
+                results[i] = result
+        return results
+    
+    def _score_batch(self, rows: List[Dict[str, Any]], model_name: str) -> List[Union[Dict[str, Any], Exception]]:
+        errors = {}
+        try:
+            plan = self.get_feature_plan(model_name)
+            model = plan.predictor
+            matrix = plan.build_matrix(rows, self._stage_timer(model_name), errors)
+            
+            if hasattr(model, 'predict_proba'):
+                with STAGE_SECONDS.time(stage="predict_proba", model=model_name):
+                    probabilities = model.predict_proba(matrix)
+                risk_scores = probabilities[:, 1] if probabilities.shape[1] > 1 else probabilities[:, 0]
+            else:
+                with STAGE_SECONDS.time(stage="predict", model=model_name):
+                    risk_scores = model.predict(matrix)
+                
+        except Exception as e:
+            logger.error(f"❌ Batch scoring failed, scoring rows one by one: {e}")
+            FALLBACKS.inc(model=self._model_label(model_name), kind="row_by_row")
+            results = []
+            for feature_values in rows:
+                try:
+                    results.append(self._calculate_risk(feature_values, model_name))
+                except Exception as row_error:
+                    results.append(row_error)
+            return results
+        
+        model_version = self.model_version(model_name)
+        return [
+            errors[r] if r in errors else
+            {"risk_score": float(score), "risk_level": self.get_risk_level(float(score)), "model_version": model_version}
+            for r, score in enumerate(risk_scores)
+        ]
+    
+    def get_ensemble_weights(self, model_names: List[str], weight_metric: str = "roc_auc") -> Dict[str, float]:
+        """Normalized weights from each model's stored validation metric (equal if missing)"""
+        raw = {}
+        for model_name in model_names:
+            entry = self.model_service.registry.get_model_entry(model_name) or {}
+            raw[model_name] = float(entry.get("metrics", {}).get(weight_metric) or 0.0)
+        
+        total = sum(raw.values())
+        if total <= 0:
+            logger.warning(f"⚠️ No stored {weight_metric} for the ensemble, weighting models equally")
+            return {model_name: 1.0 / len(model_names) for model_name in model_names}
+        return {model_name: weight / total for model_name, weight in raw.items()}
+    
+    def calculate_ensemble(self, feature_values: Dict[str, Any], model_names: List[str] = None,
+                           parallel: bool = False, weight_metric: str = "roc_auc") -> Dict[str, Any]:
+        """Score one input with every model, scaling it once and fanning the row out.
+        
+        All models share the scaler, so the row is built and scaled in the first
+        model's column order and each model gets a column permutation of it.
+        """
+        # Repeats would be weighted once per mention, pushing the score past 1
+        model_names = list(dict.fromkeys(model_names or self.model_service.get_available_models()))
+        if not model_names:
+            raise FileNotFoundError("No models available for the ensemble")
+        
+        plans = {model_name: self.get_feature_plan(model_name) for model_name in model_names}
+        reference = plans[model_names[0]]
+        row = reference.build_row(feature_values, self._stage_timer(ENSEMBLE_MODEL_NAME)).copy()
+        
+        def score(model_name: str) -> float:
+            plan = plans[model_name]
+            permutation = [reference.index[column] for column in plan.columns]
+            with STAGE_SECONDS.time(stage="predict_proba", model=model_name):
+                probabilities = plan.predictor.predict_proba(row[:, permutation])
+            return float(probabilities[0][1]) if probabilities.shape[1] > 1 else float(probabilities[0][0])
+        
+        if parallel and len(model_names) > 1:
+            if self._ensemble_pool is None:
+                self._ensemble_pool = ThreadPoolExecutor(thread_name_prefix="ensemble")
+            scores = dict(zip(model_names, self._ensemble_pool.map(score, model_names)))
         else:
-            risk_level = "high"
+            scores = {model_name: score(model_name) for model_name in model_names}
+        
+        weights = self.get_ensemble_weights(model_names, weight_metric)
+        risk_score = sum(weights[model_name] * scores[model_name] for model_name in model_names)
+        versions = {model_name: self.model_version(model_name) for model_name in model_names}
         
         return {
             "risk_score": risk_score,
-            "risk_level": risk_level
+            "risk_level": self.get_risk_level(risk_score),
+            "weight_metric": weight_metric,
+            "model_version": combine_versions(versions),
+            "models": [
+                {
+                    "model_name": model_name,
+                    "risk_score": scores[model_name],
+                    "risk_level": self.get_risk_level(scores[model_name]),
+                    "weight": weights[model_name],
+                    "model_version": versions[model_name]
+                }
+                for model_name in model_names
+            ]
+        }
+    
+    def find_counterfactuals(self, feature_values: Dict[str, Any], model_name: str = "xgboost_model",
+                             target_risk: float = 0.3, max_changes: int = 3, budget: int = None,
+                             max_results: int = 5) -> Dict[str, Any]:
+        """Search the slider space for the smallest changes that bring risk below target_risk"""
+        budget = min(budget or settings.counterfactual_budget, settings.counterfactual_max_budget)
+        result = search_counterfactuals(
+            self.get_feature_plan(model_name),
+            self.get_feature_definitions(),
+            self.get_default_values(),
+            feature_values,
+            target_risk=target_risk,
+            max_changes=max_changes,
+            budget=budget,
+            max_results=max_results
+        )
+        logger.info(f"🔎 Counterfactual search on {model_name}: {result['evaluated']} candidates, "
+                    f"{len(result['counterfactuals'])} found below {target_risk}")
+        
+        for counterfactual in result["counterfactuals"]:
+            counterfactual["risk_level"] = self.get_risk_level(counterfactual["risk_score"])
+        return {
+            "model_name": model_name,
+            "model_version": self.model_version(model_name),
+            "target_risk": target_risk,
+            "base_risk_level": self.get_risk_level(result["base_risk_score"]),
+            "budget": budget,
+            **result
         }
+    
+    def _to_frame(self, feature_values: Dict[str, Any]) -> pd.DataFrame:
+        """Defaults overlaid with the request's values as a one-row DataFrame"""
+        full_features = self.get_default_values()
+        full_features.update(feature_values)
+        
+        # Convert boolean values to integers
+        for key, value in full_features.items():
+            if isinstance(value, bool):
+                full_features[key] = int(value)
+        
+        return pd.DataFrame([full_features])
+    
+    def get_risk_level(self, risk_score: float) -> str:
+        """Map a failure probability onto the low/medium/high bands"""
+        if risk_score < 0.3:
+            return "low"
+        elif risk_score < 0.7:
+            return "medium"
+        return "high"
+    
+    def score_csv_stream(self, file_obj, model_name: str = "xgboost_model",
+                         output_format: str = "csv", chunk_size: int = None) -> Iterator[str]:
+        """Score an uploaded CSV chunk by chunk, yielding CSV or NDJSON text.
+        
+        Each chunk goes through preprocess_data and predict_proba once, so memory
+        stays bounded by the chunk size regardless of the file length.
+        """
+        chunk_size = chunk_size or settings.csv_chunk_size
+        defaults = self.get_default_values()
+        bands = np.array(["low", "medium", "high"], dtype=object)
+        
+        rows_scored = 0
+        for chunk_index, chunk in enumerate(pd.read_csv(file_obj, chunksize=chunk_size)):
+            features = chunk.copy()
+            # Fill predictors missing from the upload with the calculator defaults
+            for name, default in defaults.items():
+                if name not in features.columns:
+                    features[name] = default
+                elif features[name].dtype == bool:
+                    features[name] = features[name].astype(int)
+            
+            risk_scores = self.model_service.predict_risk(model_name, features)
+            chunk["risk_score"] = risk_scores
+            chunk["risk_level"] = bands[np.digitize(risk_scores, [0.3, 0.7])]
+            rows_scored += len(chunk)
+            
+            with STAGE_SECONDS.time(stage="serialization", model=model_name):
+                if output_format == "ndjson":
+                    text = chunk.to_json(orient="records", lines=True, date_format="iso")
+                else:
+                    text = chunk.to_csv(index=False, header=chunk_index == 0)
+            yield text
+        
+        logger.info(f"📊 Scored {rows_scored} CSV rows with {model_name}")
 
 class SentimentService:
-    def __init__(self):
-        if settings.openai_api_key:
-            openai.api_key = settings.openai_api_key
+    def __init__(self, history_store=None):
+        # Optional SentimentStore; every freshly computed analysis is queued into it
+        self.history_store = history_store
+        # Long-lived pooled clients, created by start() at app startup
+        self.http_client = None
+        self.llm_client = None
+        self.cache = AsyncSingleFlightCache(
+            max_size=settings.sentiment_cache_size,
+            ttl=settings.sentiment_cache_ttl,
+            stale_ttl=settings.sentiment_cache_stale_ttl
+        ) if settings.sentiment_cache_enabled else None
+        self.upstream_calls = {"search": 0, "llm": 0}
+        # Shared by every batch request, so concurrent batches split one upstream budget
+        self.batch_limiter = AsyncRateLimiter(settings.sentiment_batch_rate_per_second)
+        self.context_builder = ContextBuilder(
+            token_budget=settings.sentiment_context_token_budget,
+            similarity_threshold=settings.sentiment_context_similarity,
+            max_sources=settings.sentiment_context_max_sources
+        )
+        self.context_metrics = {
+            "prompts": 0, "raw_tokens": 0, "context_tokens": 0, "duplicates_dropped": 0,
+            "llm_calls": 0, "llm_seconds": 0.0, "llm_prompt_tokens": 0
+        }
+        
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(settings.upstream_read_timeout, connect=settings.upstream_connect_timeout)
+        
+    async def start(self):
+        """Open the pooled search and LLM clients"""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                base_url=settings.serper_base_url,
+                timeout=self._timeout(),
+                limits=httpx.Limits(
+                    max_connections=settings.upstream_max_connections,
+                    max_keepalive_connections=settings.upstream_max_keepalive
+                )
+            )
+        if self.llm_client is None and settings.openai_api_key:
+            self.llm_client = openai.AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                timeout=self._timeout(),
+                max_retries=settings.upstream_max_retries
+            )
+        logger.info("🔌 Sentiment upstream clients ready")
+            
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.llm_client is not None:
+            await self.llm_client.close()
+            self.llm_client = None
+            
+    async def _post_with_retries(self, url: str, **kwargs) -> httpx.Response:
+        """POST through the pooled client, retrying connection errors, 429 and 5xx with backoff"""
+        if self.http_client is None:
+            await self.start()
+            
+        for attempt in range(settings.upstream_max_retries + 1):
+            try:
+                response = await self.http_client.post(url, **kwargs)
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"Upstream returned {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+                
+            if attempt < settings.upstream_max_retries:
+                delay = 0.25 * 2 ** attempt
+                logger.warning(f"⚠️ {url} failed ({error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        raise error
             
-    async def search_web(self, query: str) -> List[Dict[str, str]]:
+    async def search_web(self, company_name: str, topic: str = "news sentiment") -> List[Dict[str, Any]]:
         if not settings.serper_api_key:
             # Fallback to mock data for demo
             return [
-                {"title": f"Latest news about {query}", "snippet": "Positive growth indicators..."},
-                {"title": f"{query} quarterly report", "snippet": "Strong performance in Q4..."},
-                {"title": f"Market analysis: {query}", "snippet": "Analysts remain optimistic..."}
+                {"title": f"Latest news about {company_name}", "snippet": "Positive growth indicators...", "position": 0},
+                {"title": f"{company_name} quarterly report", "snippet": "Strong performance in Q4...", "position": 1},
+                {"title": f"Market analysis: {company_name}", "snippet": "Analysts remain optimistic...", "position": 2}
             ]
             
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://google.serper.dev/search",
+        self.upstream_calls["search"] += 1
+        with time_upstream("search"):
+            response = await self._post_with_retries(
+                "/search",
                 headers={"X-API-KEY": settings.serper_api_key},
-                json={"q": f"{query} news sentiment", "num": 10}
+                json={"q": f"{company_name} {topic}", "num": settings.sentiment_search_results}
             )
-            data = response.json()
-            return [{"title": r.get("title", ""), "snippet": r.get("snippet", "")} 
-                    for r in data.get("organic", [])]
+        data = response.json()
+        return [{"title": r.get("title", ""), "snippet": r.get("snippet", ""), "position": position}
+                for position, r in enumerate(data.get("organic", []))]
+            
+    async def gather_sources(self, company_name: str) -> List[Dict[str, Any]]:
+        """Run every configured search query in parallel and merge the results.
+        
+        A failing query is logged and skipped; the search only fails if all do.
+        """
+        topics = settings.sentiment_search_queries or ["news sentiment"]
+        responses = await asyncio.gather(
+            *(self.search_web(company_name, topic) for topic in topics),
+            return_exceptions=True
+        )
+        merged, errors = [], []
+        for topic, response in zip(topics, responses):
+            if isinstance(response, BaseException):
+                logger.warning(f"⚠️ Search '{company_name} {topic}' failed: {response}")
+                errors.append(response)
+            else:
+                merged.extend(response)
+        if errors and len(errors) == len(topics):
+            raise errors[0]
+        return merged
+        
+    def build_context(self, company_name: str, web_results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, str]]]:
+        """Dedupe, rank and budget the search results; returns (prompt content, sources used)"""
+        content, sources, stats = self.context_builder.build(company_name, web_results)
+        metrics = self.context_metrics
+        metrics["prompts"] += 1
+        metrics["raw_tokens"] += stats["raw_tokens"]
+        metrics["context_tokens"] += stats["context_tokens"]
+        metrics["duplicates_dropped"] += stats["duplicates"]
+        logger.info(
+            f"🧾 Context for {company_name}: {stats['selected']}/{stats['results']} sources, "
+            f"{stats['duplicates']} duplicates dropped, {stats['raw_tokens']} -> {stats['context_tokens']} tokens"
+        )
+        return content, sources
+        
+    def _record_llm_call(self, elapsed: float, prompt_tokens: int):
+        self.context_metrics["llm_calls"] += 1
+        self.context_metrics["llm_seconds"] += elapsed
+        self.context_metrics["llm_prompt_tokens"] += prompt_tokens
+        
+    def context_stats(self) -> Dict[str, Any]:
+        """Prompt-size totals plus the LLM time saved, estimated from observed seconds per prompt token"""
+        metrics = dict(self.context_metrics)
+        trimmed = metrics["raw_tokens"] - metrics["context_tokens"]
+        seconds_per_token = metrics["llm_seconds"] / metrics["llm_prompt_tokens"] if metrics["llm_prompt_tokens"] else 0.0
+        metrics["tokens_trimmed"] = trimmed
+        metrics["trimmed_ratio"] = trimmed / metrics["raw_tokens"] if metrics["raw_tokens"] else 0.0
+        metrics["estimated_llm_seconds_saved"] = trimmed * seconds_per_token
+        return metrics
+            
+    @staticmethod
+    def normalize_company(company_name: str) -> str:
+        """Cache key for a company: trimmed, case-folded, single-spaced"""
+        return " ".join(company_name.split()).casefold()
+        
+    async def analyze_sentiment(self, company_name: str, rate_limited: bool = False) -> Dict[str, Any]:
+        """Analyze a company, sharing cached and in-flight results for the same name.
+        
+        With rate_limited, a fresh analysis first waits for a batch_limiter token;
+        cached and coalesced results never do.
+        """
+        if self.cache is None:
+            return await self._analyze_sentiment(company_name, rate_limited)
+        result = await self.cache.get_or_compute(
+            self.normalize_company(company_name),
+            lambda: self._analyze_sentiment(company_name, rate_limited)
+        )
+        return self._for_caller(result, company_name)
+        
+    @staticmethod
+    def _for_caller(result: Dict[str, Any], company_name: str) -> Dict[str, Any]:
+        # Cached under the normalized name: answer with the spelling this caller sent
+        return {**result, "company_name": company_name}
+        
+    async def analyze_many(self, company_names: List[str], max_concurrency: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """Analyze many companies concurrently, yielding each result as soon as it finishes.
+        
+        At most max_concurrency companies are in flight at once, and analyses that
+        miss the cache start no faster than the rate budget shared by all batches.
+        Failures are yielded as error entries instead of aborting the batch.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or settings.sentiment_batch_concurrency)
+        
+        async def run(company_name: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await self.analyze_sentiment(company_name, rate_limited=True)
+                    return {"company_name": company_name, "status": "ok", "result": result}
+                except Exception as e:
+                    logger.error(f"❌ Sentiment analysis failed for {company_name}: {e}")
+                    return {"company_name": company_name, "status": "error", "error": str(e)}
+        
+        tasks = [asyncio.create_task(run(company_name)) for company_name in company_names]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away or the batch finished: stop anything still queued
+            for task in tasks:
+                task.cancel()
+        
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = {
+            "enabled": self.cache is not None,
+            "upstream_calls": dict(self.upstream_calls),
+            "context": self.context_stats()
+        }
+        if self.history_store is not None:
+            stats["history"] = self.history_store.stats()
+        if self.cache is not None:
+            stats.update(self.cache.stats())
+        return stats
             
-    async def analyze_sentiment(self, company_name: str) -> Dict[str, Any]:
-        # Search for web content
-        web_results = await self.search_web(company_name)
+    def _build_messages(self, company_name: str, content: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "Analyze the sentiment and risk level of the company based on the provided text. Return a JSON with sentiment_score (0-1), risk_level (low/medium/high), and contributing_factors (list of strings)."},
+            {"role": "user", "content": f"Company: {company_name}\n\nContent:\n{content}"}
+        ]
         
-        # Combine snippets for analysis
-        content = "\n".join([f"{r['title']}: {r['snippet']}" for r in web_results])
+    def _demo_analysis(self) -> Dict[str, Any]:
+        # Demo sentiment analysis
+        sentiment_score = np.random.uniform(0.3, 0.9)
+        risk_level = "low" if sentiment_score > 0.7 else "medium" if sentiment_score > 0.4 else "high"
+        factors = [
+            "Strong financial performance" if sentiment_score > 0.7 else "Market volatility",
+            "Positive analyst ratings" if sentiment_score > 0.6 else "Competitive pressure",
+            "Growing market share" if sentiment_score > 0.5 else "Regulatory concerns"
+        ]
+        return {"sentiment_score": sentiment_score, "risk_level": risk_level, "contributing_factors": factors}
+        
+    def _build_result(self, company_name: str, analysis: Dict[str, Any],
+                      web_results: List[Dict[str, str]]) -> Dict[str, Any]:
+        result = {
+            "company_name": company_name,
+            "sentiment_score": analysis["sentiment_score"],
+            "risk_level": analysis["risk_level"],
+            "contributing_factors": analysis["contributing_factors"],
+            "web_sources": web_results,
+            "timestamp": datetime.now()
+        }
+        # Without both API keys the sources and/or the score are mock data, which
+        # would show up in the history and trends as if they were real
+        if self.history_store is not None and settings.serper_api_key and settings.openai_api_key:
+            self.history_store.record(result)
+        return result
+        
+    async def _analyze_sentiment(self, company_name: str, rate_limited: bool = False) -> Dict[str, Any]:
+        if rate_limited:
+            await self.batch_limiter.acquire()
+        # Search for web content and keep what fits the prompt budget
+        content, web_results = self.build_context(company_name, await self.gather_sources(company_name))
         
         # Analyze sentiment (mock if no API key)
         if not settings.openai_api_key:
-            # Demo sentiment analysis
-            sentiment_score = np.random.uniform(0.3, 0.9)
-            risk_level = "low" if sentiment_score > 0.7 else "medium" if sentiment_score > 0.4 else "high"
-            factors = [
-                "Strong financial performance" if sentiment_score > 0.7 else "Market volatility",
-                "Positive analyst ratings" if sentiment_score > 0.6 else "Competitive pressure",
-                "Growing market share" if sentiment_score > 0.5 else "Regulatory concerns"
-            ]
+            analysis = self._demo_analysis()
         else:
-            # Real OpenAI analysis
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Analyze the sentiment and risk level of the company based on the provided text. Return a JSON with sentiment_score (0-1), risk_level (low/medium/high), and contributing_factors (list of strings)."},
-                    {"role": "user", "content": f"Company: {company_name}\n\nContent:\n{content}"}
-                ],
-                temperature=0.3
-            )
+            # Real OpenAI analysis, awaited so the event loop keeps serving other requests
+            if self.llm_client is None:
+                await self.start()
+            self.upstream_calls["llm"] += 1
+            messages = self._build_messages(company_name, content)
+            started = time.perf_counter()
+            with time_upstream("llm"):
+                response = await self.llm_client.chat.completions.create(
+                    model=settings.openai_model,
+                    messages=messages,
+                    temperature=0.3
+                )
+            prompt_tokens = response.usage.prompt_tokens if response.usage else estimate_prompt_tokens(messages)
+            self._record_llm_call(time.perf_counter() - started, prompt_tokens)
             analysis = json.loads(response.choices[0].message.content)
-            sentiment_score = analysis["sentiment_score"]
-            risk_level = analysis["risk_level"]
-            factors = analysis["contributing_factors"]
             
-        return {
-            "company_name": company_name,
-            "sentiment_score": sentiment_score,
-            "risk_level": risk_level,
-            "contributing_factors": factors,
-            "web_sources": web_results,
-            "timestamp": datetime.now()
-        }
\ No newline at end of file
+        return self._build_result(company_name, analysis, web_results)
+        
+    async def stream_sentiment(self, company_name: str) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (event, data) pairs: sources as soon as the search returns, analysis
+        deltas while the LLM generates, then the full result.
+        
+        A cached analysis is replayed immediately. A miss runs as the cache's
+        single-flight computation: a stream that finds one already running waits
+        for its result instead of calling upstream again, and the analysis
+        finishes (and is cached) even if this client disconnects.
+        """
+        key = self.normalize_company(company_name)
+        cached = self.cache.peek(key) if self.cache is not None else None
+        if cached is None and self.cache is not None and self.cache.in_flight(key):
+            cached = await self.cache.get_or_compute(key, lambda: self._analyze_sentiment(company_name))
+        if cached is not None:
+            yield "sources", cached["web_sources"]
+            yield "result", self._for_caller(cached, company_name)
+            return
+        
+        events = asyncio.Queue()
+        compute = lambda: self._stream_analysis(company_name, events)
+        task = self.cache.start(key, compute) if self.cache is not None else asyncio.create_task(compute())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            result = await asyncio.shield(task)
+        finally:
+            if self.cache is None and not task.done():
+                # Nobody else can use the result
+                task.cancel()
+        yield "result", self._for_caller(result, company_name)
+        
+    async def _stream_analysis(self, company_name: str, events: "asyncio.Queue") -> Dict[str, Any]:
+        """Run one analysis, putting sources and LLM deltas on events, then None"""
+        try:
+            content, web_results = self.build_context(company_name, await self.gather_sources(company_name))
+            events.put_nowait(("sources", web_results))
+            
+            if not settings.openai_api_key:
+                analysis = self._demo_analysis()
+            else:
+                if self.llm_client is None:
+                    await self.start()
+                self.upstream_calls["llm"] += 1
+                messages = self._build_messages(company_name, content)
+                started = time.perf_counter()
+                parts = []
+                with time_upstream("llm"):
+                    stream = await self.llm_client.chat.completions.create(
+                        model=settings.openai_model,
+                        messages=messages,
+                        temperature=0.3,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            events.put_nowait(("analysis", {"delta": delta}))
+                self._record_llm_call(time.perf_counter() - started, estimate_prompt_tokens(messages))
+                analysis = json.loads("".join(parts))
+            
+            return self._build_result(company_name, analysis, web_results)
+        finally:
+            events.put_nowait(None)
@@ -5,6 +5,7 @@ import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.metrics import precision_score, recall_score, f1_score, roc_auc_score
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
@@ -17,89 +18,313 @@ import statsmodels.api as sm
 from statsmodels.tools.tools import add_constant
 from statsmodels.stats.outliers_influence import variance_inflation_factor
 import numpy as np
+import hashlib
+import importlib.metadata
+import json
 import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
+from model_registry import ModelRegistry, file_sha256, write_manifest
+from model_artifacts import save_fast_artifact
+from dataset_cache import load_dataset
+from hyperparameter_search import cached_folds, load_tuning, save_tuning, tune
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FINGERPRINTS_NAME = "fingerprints.json"
+PREPROCESSED_DIR = "preprocessed"
+SPLIT_PARAMS = {"test_size": 0.3, "random_state": 42}
+TARGET = "Closed Dummy"
+
+# Full predictor list (part of every model fingerprint)
+PREDICTORS = [
+    # 'Number of Investors',
+    #'Patents Granted',
+    "Trademarks Registered",
+    #'Number of Funding Rounds',
+    "Number of Events",
+    #'Number of Articles',
+    "Diversity Spotlight Dummy",
+    "Repeat_Founder",
+    #'America Dummy',
+    "Asia Dummy",
+    "Middle East Dummy",
+    "Financing for entrepreneurs",
+    "Governmental support and policies",
+    "Taxes and bureaucracy",
+    "Governmental programs",
+    "R&D transfer",
+    "Basic school entrepreneurial education and training",
+    "Post school entrepreneurial education and training",
+    "Physical and services infrastructure",
+    "Commercial and professional infrastructure",
+    "Internal market dynamics",
+    "Internal market openness",
+    "Cultural and social norms",
+    "Food and Restaurant Dummy",
+    "High Tech Dummy",
+]
+
+# scale vs leave unscaled
+SCALE_FEATURES = [
+    # 'Number of Investors',
+    #'Patents Granted',
+    "Trademarks Registered",
+    #'Number of Funding Rounds',
+    "Number of Events",
+    #'Number of Articles',
+    "Financing for entrepreneurs",
+    "Governmental support and policies",
+    "Basic school entrepreneurial education and training",
+    "Post school entrepreneurial education and training",
+    "Taxes and bureaucracy",
+    "Governmental programs",
+    "R&D transfer",
+    "Physical and services infrastructure",
+    "Commercial and professional infrastructure",
+    "Internal market dynamics",
+    "Internal market openness",
+    "Cultural and social norms",
+]
+
+LEAVE_UNSCALED = [
+    "Diversity Spotlight Dummy",
+    "Repeat_Founder",
+    #'America Dummy',
+    "Asia Dummy",
+    "Middle East Dummy",
+    "Food and Restaurant Dummy",
+    "High Tech Dummy",
+]
+
+
+def evaluate_model(model, X_test, y_test):
+    """Held-out metrics stored in the manifest for serving"""
+    y_pred = model.predict(X_test)
+    y_proba = model.predict_proba(X_test)[:, 1]
+    return {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "precision": float(precision_score(y_test, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, zero_division=0)),
+        "f1": float(f1_score(y_test, y_pred, zero_division=0)),
+        "roc_auc": float(roc_auc_score(y_test, y_proba)),
+    }
 
-def train_ml_models():
-    """Train multiple ML models and save them for the application"""
 
-    logger.info("🚀 Starting ML model training pipeline...")
+def _build_logistic_regression(n_jobs):
+    return LogisticRegression(solver="liblinear", max_iter=1000, random_state=42)
 
-    # Load data from the correct location
-    csv_path = Path("riskDBv4_1.csv")
-    if not csv_path.exists():
-        raise FileNotFoundError(f"CSV file not found at {csv_path}")
 
+def _build_decision_tree(n_jobs):
+    return DecisionTreeClassifier(max_depth=5, random_state=42)
+
+
+def _build_random_forest(n_jobs):
+    return RandomForestClassifier(n_estimators=100, max_depth=5, random_state=42, n_jobs=n_jobs)
+
+
+def _build_xgboost(n_jobs):
+    return XGBClassifier(
+        use_label_encoder=False,
+        eval_metric="logloss",
+        max_depth=5,
+        n_estimators=100,
+        random_state=42,
+        n_jobs=n_jobs,
+    )
+
+
+# key -> how to build, name and report each model. "parallel" models use every
+# core they are given; the others are single-threaded fits.
+MODEL_SPECS = {
+    "logistic_regression": {
+        "label": "Logistic Regression", "emoji": "🤖", "artifact": "logistic_regression_model",
+        "build": _build_logistic_regression, "parallel": False,
+    },
+    "decision_tree": {
+        "label": "Decision Tree", "emoji": "🌳", "artifact": "decision_tree_model",
+        "build": _build_decision_tree, "parallel": False,
+    },
+    "random_forest": {
+        "label": "Random Forest", "emoji": "🌲", "artifact": "random_forest_model",
+        "build": _build_random_forest, "parallel": True,
+    },
+    "xgboost": {
+        "label": "XGBoost", "emoji": "🚀", "artifact": "xgboost_model",
+        "build": _build_xgboost, "parallel": True,
+    },
+}
+
+
+def allocate_cores(keys, total_cores=None):
+    """Split total_cores between the models: one per single-threaded fit, the
+    rest shared evenly by the multi-threaded ones (at least one core each)"""
+    total_cores = total_cores or os.cpu_count() or 1
+    parallel = [key for key in keys if MODEL_SPECS[key]["parallel"]]
+    spare = max(total_cores - (len(keys) - len(parallel)), len(parallel))
+    allocation = {key: 1 for key in keys}
+    for i, key in enumerate(parallel):
+        allocation[key] = spare // len(parallel) + (1 if i < spare % len(parallel) else 0)
+    return allocation
+
+
+def build_model(key, n_jobs, tuning=None):
+    """Default estimator for key, with the tuned hyperparameters from tuning.json applied"""
+    model = MODEL_SPECS[key]["build"](n_jobs)
+    params = (tuning or {}).get(MODEL_SPECS[key]["artifact"], {}).get("params")
+    if params:
+        model.set_params(**params)
+    return model
+
+
+def fit_and_evaluate(key, n_jobs, X_train, y_train, X_test, y_test, models_dir, tuning=None):
+    """Fit one model, save it and report its held-out metrics (runs in a worker process)"""
+    spec = MODEL_SPECS[key]
+    logger.info(f"{spec['emoji']} Training {spec['label'].upper()} on {n_jobs} cores")
+
+    started = time.perf_counter()
+    model = build_model(key, n_jobs, tuning)
+    model.fit(X_train, y_train)
+    seconds = time.perf_counter() - started
+
+    path = Path(models_dir) / f"{spec['artifact']}.pkl"
+    with open(path, "wb") as f:
+        pickle.dump(model, f)
+    # Written after the pickle: serving only trusts a fast artifact at least as new
+    fast_path = save_fast_artifact(model, models_dir, spec["artifact"])
+    logger.info(f"💾 {spec['label']} model saved to {path}" + (f" and {fast_path.name}" if fast_path else ""))
+
+    metrics = evaluate_model(model, X_test, y_test)
+    logger.info(f"📊 {spec['label']} Test Set Accuracy: {metrics['accuracy']:.4f}")
+    logger.info(
+        f"📊 {spec['label']} Classification Report:\n{classification_report(y_test, model.predict(X_test))}"
+    )
+
+    if hasattr(model, "coef_"):
+        weights = pd.DataFrame(
+            {"Feature": X_train.columns, "Coefficient": model.coef_[0]}
+        ).sort_values(by="Coefficient", key=abs, ascending=False)
+        logger.info(f"📊 Top 10 {spec['label']} Coefficients:\n{weights.head(10)}")
+    else:
+        weights = pd.DataFrame(
+            {"Feature": X_train.columns, "Importance": model.feature_importances_}
+        ).sort_values(by="Importance", ascending=False)
+        logger.info(f"📊 Top 10 {spec['label']} Feature Importances:\n{weights.head(10)}")
+
+    return {"metrics": metrics, "path": str(path), "seconds": seconds, "n_jobs": n_jobs}
+
+
+def run_model_jobs(keys, X_train, y_train, X_test, y_test, models_dir, workers=None, total_cores=None,
+                   tuning=None):
+    """Train every model in keys concurrently, one process each; returns key -> result"""
+    if not keys:
+        return {}
+    allocation = allocate_cores(keys, total_cores)
+    # Extra processes only pay off with a spare core each (spawning one costs seconds of imports)
+    workers = min(workers or os.cpu_count() or 1, len(keys))
+    logger.info(f"⚙️ Core allocation: {allocation} across {workers} worker processes")
+
+    if workers == 1:
+        return {
+            key: fit_and_evaluate(key, allocation[key], X_train, y_train, X_test, y_test, models_dir, tuning)
+            for key in keys
+        }
+
+    # spawn: forking after numpy/OpenMP threads exist can deadlock the children
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            key: pool.submit(
+                fit_and_evaluate, key, allocation[key], X_train, y_train, X_test, y_test, models_dir, tuning
+            )
+            for key in keys
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
+def preprocess_fingerprint(csv_path):
+    """Hash of everything the train/test matrices depend on"""
+    return _digest({
+        "data_sha256": file_sha256(csv_path),
+        "predictors": PREDICTORS,
+        "scale_features": SCALE_FEATURES,
+        "leave_unscaled": LEAVE_UNSCALED,
+        "split": SPLIT_PARAMS,
+    })
+
+
+def model_config(key, tuning=None):
+    """Estimator class, library version and hyperparameters (n_jobs aside, it does not change the fit)"""
+    model = build_model(key, 1, tuning)
+    params = {name: value for name, value in model.get_params().items() if name != "n_jobs"}
+    library = type(model).__module__.split(".")[0]
+    return {
+        "class": type(model).__name__,
+        "library_version": importlib.metadata.version("scikit-learn" if library == "sklearn" else library),
+        "params": json.loads(json.dumps(params, sort_keys=True, default=repr)),
+    }
+
+
+def model_fingerprint(key, data_fingerprint, tuning=None):
+    return _digest({"data": data_fingerprint, "config": model_config(key, tuning)})
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def load_fingerprints(models_dir):
+    path = Path(models_dir) / FINGERPRINTS_NAME
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {"models": {}}
+
+
+def save_fingerprints(models_dir, fingerprints):
+    path = Path(models_dir) / FINGERPRINTS_NAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(fingerprints, f, indent=2)
+    tmp_path.replace(path)
+    return path
+
+
+def load_preprocessed(csv_path, models_dir, data_fingerprint):
+    """Train/test matrices and scaler, cached under models/preprocessed/ by fingerprint"""
+    cache_dir = Path(models_dir) / PREPROCESSED_DIR
+    cache_path = cache_dir / f"{data_fingerprint[:16]}.joblib"
+    if cache_path.exists():
+        logger.info(f"♻️ Reusing preprocessed matrices from {cache_path}")
+        return joblib.load(cache_path)
+
+    data = preprocess(csv_path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Older matrices belong to data or feature lists that no longer exist
+    for old in cache_dir.glob("*.joblib"):
+        old.unlink()
+    joblib.dump(data, cache_path)
+    logger.info(f"💾 Preprocessed matrices cached at {cache_path}")
+    return data
+
+
+def preprocess(csv_path):
+    """Load the CSV, run the VIF diagnostics, split and fit the serving scaler"""
     logger.info(f"📊 Loading data from {csv_path}")
-    df = pd.read_csv(csv_path)
+    # Typed columnar copy of the CSV, reading only the columns training uses
+    df = load_dataset(csv_path, columns=[*PREDICTORS, TARGET])
     logger.info(f"✅ Data loaded - Shape: {df.shape}")
     logger.info(f"📋 Columns: {list(df.columns)}")
 
-    # Full predictor list
-    predictors = [
-        # 'Number of Investors',
-        #'Patents Granted',
-        "Trademarks Registered",
-        #'Number of Funding Rounds',
-        "Number of Events",
-        #'Number of Articles',
-        "Diversity Spotlight Dummy",
-        "Repeat_Founder",
-        #'America Dummy',
-        "Asia Dummy",
-        "Middle East Dummy",
-        "Financing for entrepreneurs",
-        "Governmental support and policies",
-        "Taxes and bureaucracy",
-        "Governmental programs",
-        "R&D transfer",
-        "Basic school entrepreneurial education and training",
-        "Post school entrepreneurial education and training",
-        "Physical and services infrastructure",
-        "Commercial and professional infrastructure",
-        "Internal market dynamics",
-        "Internal market openness",
-        "Cultural and social norms",
-        "Food and Restaurant Dummy",
-        "High Tech Dummy",
-    ]
-
-    # scale vs leave unscaled
-    scale_features = [
-        # 'Number of Investors',
-        #'Patents Granted',
-        "Trademarks Registered",
-        #'Number of Funding Rounds',
-        "Number of Events",
-        #'Number of Articles',
-        "Financing for entrepreneurs",
-        "Governmental support and policies",
-        "Basic school entrepreneurial education and training",
-        "Post school entrepreneurial education and training",
-        "Taxes and bureaucracy",
-        "Governmental programs",
-        "R&D transfer",
-        "Physical and services infrastructure",
-        "Commercial and professional infrastructure",
-        "Internal market dynamics",
-        "Internal market openness",
-        "Cultural and social norms",
-    ]
-
-    leave_unscaled = [
-        "Diversity Spotlight Dummy",
-        "Repeat_Founder",
-        #'America Dummy',
-        "Asia Dummy",
-        "Middle East Dummy",
-        "Food and Restaurant Dummy",
-        "High Tech Dummy",
-    ]
+    predictors = list(PREDICTORS)
+    scale_features = list(SCALE_FEATURES)
+    leave_unscaled = list(LEAVE_UNSCALED)
 
     # Check if all required columns exist
     missing_columns = [col for col in predictors if col not in df.columns]
@@ -119,7 +344,7 @@ def train_ml_models():
     X_scaled[leave_unscaled] = df[leave_unscaled].reset_index(drop=True)
 
     # Target variable
-    y = df["Closed Dummy"]
+    y = df[TARGET]
 
     logger.info(f"🎯 Target variable shape: {y.shape}")
     logger.info(f"📊 Class distribution: {y.value_counts().to_dict()}")
@@ -138,183 +363,187 @@ def train_ml_models():
     logger.info(vif_data.to_string())
 
     # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_scaled, y, test_size=0.3, random_state=42
-    )
+    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, **SPLIT_PARAMS)
     logger.info(f"📊 Train set: {X_train.shape}, Test set: {X_test.shape}")
 
-    # Create models directory if it doesn't exist
-    models_dir = Path("models")
-    models_dir.mkdir(exist_ok=True)
-
-    # 1. LOGISTIC REGRESSION
-    logger.info("\n" + "=" * 50)
-    logger.info("🤖 Training LOGISTIC REGRESSION")
-    logger.info("=" * 50)
-
-    logit_model = LogisticRegression(solver="liblinear", max_iter=1000, random_state=42)
-    logit_model.fit(X_train, y_train)
-
-    # Save logistic regression model
-    logit_path = models_dir / "logistic_regression_model.pkl"
-    with open(logit_path, "wb") as f:
-        pickle.dump(logit_model, f)
-    logger.info(f"💾 Logistic regression model saved to {logit_path}")
+    # Scaler used at serving time, fit on the full data set
+    scaler = StandardScaler()
+    scaler.fit(df[scale_features])
 
-    # Evaluate
-    y_pred_logit = logit_model.predict(X_test)
-    accuracy = accuracy_score(y_test, y_pred_logit)
-    logger.info(f"📊 Test Set Accuracy: {accuracy:.4f}")
-    logger.info(
-        f"📊 Classification Report:\n{classification_report(y_test, y_pred_logit)}"
-    )
+    return {
+        "predictors": predictors,
+        "scale_features": scale_features,
+        "leave_unscaled": leave_unscaled,
+        "X_train": X_train,
+        "X_test": X_test,
+        "y_train": y_train,
+        "y_test": y_test,
+        "scaler": scaler,
+    }
 
-    # Coefficients
-    coefficients = pd.DataFrame(
-        {"Feature": X_train.columns, "Coefficient": logit_model.coef_[0]}
-    ).sort_values(by="Coefficient", key=abs, ascending=False)
-    logger.info(f"📊 Top 10 Logistic Regression Coefficients:\n{coefficients.head(10)}")
 
-    # 2. DECISION TREE
-    logger.info("\n" + "=" * 50)
-    logger.info("🌳 Training DECISION TREE")
-    logger.info("=" * 50)
+def tune_ml_models(keys, data, models_dir, data_fingerprint, total_cores=None):
+    """Search hyperparameters for keys on shared cached folds and save them to tuning.json"""
+    n_jobs = total_cores or os.cpu_count() or 1
+    folds = cached_folds(data["X_train"], data["y_train"], Path(models_dir) / PREPROCESSED_DIR, data_fingerprint)
+    logger.info(f"🎛️ Tuning {keys} with {len(folds)}-fold CV on {n_jobs} cores")
 
-    dt_model = DecisionTreeClassifier(max_depth=5, random_state=42)
-    dt_model.fit(X_train, y_train)
+    tuning = load_tuning(models_dir)
+    for key in keys:
+        tuning[MODEL_SPECS[key]["artifact"]] = tune(
+            key, build_model(key, 1), data["X_train"], data["y_train"], folds, n_jobs
+        )
+        # Saved after every model so an interrupted search keeps its finished results
+        save_tuning(models_dir, tuning)
+    return tuning
 
-    # Save Decision Tree model
-    dt_path = models_dir / "decision_tree_model.pkl"
-    with open(dt_path, "wb") as f:
-        pickle.dump(dt_model, f)
-    logger.info(f"💾 Decision Tree model saved to {dt_path}")
 
-    # Evaluate
-    y_pred_dt = dt_model.predict(X_test)
-    accuracy_dt = accuracy_score(y_test, y_pred_dt)
-    logger.info(f"📊 Test Set Accuracy: {accuracy_dt:.4f}")
-    logger.info(
-        f"📊 Classification Report:\n{classification_report(y_test, y_pred_dt)}"
-    )
+def train_ml_models(models=None, workers=None, total_cores=None, force=False, tune=False):
+    """Train multiple ML models and save them for the application.
 
-    # Feature importance
-    feature_importance_dt = pd.DataFrame(
-        {"Feature": X_train.columns, "Importance": dt_model.feature_importances_}
-    ).sort_values(by="Importance", ascending=False)
-    logger.info(
-        f"📊 Top 10 Decision Tree Feature Importances:\n{feature_importance_dt.head(10)}"
-    )
-
-    # 3. RANDOM FOREST
-    logger.info("\n" + "=" * 50)
-    logger.info("🌲 Training RANDOM FOREST")
-    logger.info("=" * 50)
-
-    rf_model = RandomForestClassifier(n_estimators=100, max_depth=5, random_state=42)
-    rf_model.fit(X_train, y_train)
+    models is a list of MODEL_SPECS keys (default: all of them). A model whose
+    fingerprint (data, feature lists, config) matches its last training run is
+    skipped unless force is set. The remaining fits run concurrently in a
+    process pool of up to `workers` processes (default: one per core), sharing
+    total_cores (default: every core) between them; see allocate_cores.
 
-    # Save Random Forest model
-    rf_path = models_dir / "random_forest_model.pkl"
-    with open(rf_path, "wb") as f:
-        pickle.dump(rf_model, f)
-    logger.info(f"💾 Random Forest model saved to {rf_path}")
+    With tune, the selected models' hyperparameters are searched first (see
+    hyperparameter_search) and every model whose best config changed is retrained.
+    """
 
-    # Evaluate
-    y_pred_rf = rf_model.predict(X_test)
-    accuracy_rf = accuracy_score(y_test, y_pred_rf)
-    logger.info(f"📊 Test Set Accuracy: {accuracy_rf:.4f}")
-    logger.info(
-        f"📊 Classification Report:\n{classification_report(y_test, y_pred_rf)}"
-    )
+    selected = list(models or MODEL_SPECS)
+    unknown = [key for key in selected if key not in MODEL_SPECS]
+    if unknown:
+        raise ValueError(f"Unknown models {unknown}, expected some of {list(MODEL_SPECS)}")
 
-    # Feature importances
-    feature_importance_rf = pd.DataFrame(
-        {"Feature": X_train.columns, "Importance": rf_model.feature_importances_}
-    ).sort_values(by="Importance", ascending=False)
-    logger.info(
-        f"📊 Top 10 Random Forest Feature Importances:\n{feature_importance_rf.head(10)}"
-    )
+    logger.info(f"🚀 Starting ML model training pipeline for {selected}...")
 
-    # 4. XGBOOST
-    logger.info("\n" + "=" * 50)
-    logger.info("🚀 Training XGBOOST")
-    logger.info("=" * 50)
+    # Load data from the correct location
+    csv_path = Path("riskDBv4_1.csv")
+    if not csv_path.exists():
+        raise FileNotFoundError(f"CSV file not found at {csv_path}")
 
-    xgb_model = XGBClassifier(
-        use_label_encoder=False,
-        eval_metric="logloss",
-        max_depth=5,
-        n_estimators=100,
-        random_state=42,
-    )
-    xgb_model.fit(X_train, y_train)
-
-    # Save XGBoost model
-    xgb_path = models_dir / "xgboost_model.pkl"
-    with open(xgb_path, "wb") as f:
-        pickle.dump(xgb_model, f)
-    logger.info(f"💾 XGBoost model saved to {xgb_path}")
-
-    # Evaluate
-    y_pred_xgb = xgb_model.predict(X_test)
-    accuracy_xgb = accuracy_score(y_test, y_pred_xgb)
-    logger.info(f"📊 Test Set Accuracy: {accuracy_xgb:.4f}")
-    logger.info(
-        f"📊 Classification Report:\n{classification_report(y_test, y_pred_xgb)}"
-    )
+    # Create models directory if it doesn't exist
+    models_dir = Path("models")
+    models_dir.mkdir(exist_ok=True)
+    model_info_path = models_dir / "model_info.pkl"
 
-    # Feature importances
-    feature_importance_xgb = pd.DataFrame(
-        {"Feature": X_train.columns, "Importance": xgb_model.feature_importances_}
-    ).sort_values(by="Importance", ascending=False)
-    logger.info(
-        f"📊 Top 10 XGBoost Feature Importances:\n{feature_importance_xgb.head(10)}"
+    # Skip every model whose inputs are unchanged since its artifact was written
+    data_fingerprint = preprocess_fingerprint(csv_path)
+    tuning = load_tuning(models_dir)
+    data = None
+    if tune:
+        data = load_preprocessed(csv_path, models_dir, data_fingerprint)
+        tuning = tune_ml_models(selected, data, models_dir, data_fingerprint, total_cores)
+    fingerprints = load_fingerprints(models_dir)
+    registry = ModelRegistry(models_dir)
+    stale = []
+    for key in selected:
+        artifact = MODEL_SPECS[key]["artifact"]
+        recorded = fingerprints["models"].get(artifact, {}).get("fingerprint")
+        if force or recorded != model_fingerprint(key, data_fingerprint, tuning) or not registry.verify(artifact):
+            stale.append(key)
+        else:
+            logger.info(f"⏭️ {MODEL_SPECS[key]['label']} is up to date, skipping")
+
+    if not stale and not tune and model_info_path.exists():
+        logger.info("✅ Nothing changed since the last training run")
+        with open(model_info_path, "rb") as f:
+            return pickle.load(f)
+
+    # Every model is fitted on the matrices scaled by the scaler saved below, so
+    # one left over from other data (or of unknown lineage) is retrained with it
+    for key, spec in MODEL_SPECS.items():
+        artifact = spec["artifact"]
+        if key in stale or not (models_dir / f"{artifact}.pkl").exists():
+            continue
+        if fingerprints["models"].get(artifact, {}).get("data_fingerprint") != data_fingerprint:
+            logger.warning(f"⚠️ {spec['label']} was trained with a different scaler, retraining it too")
+            stale.append(key)
+
+    data = data or load_preprocessed(csv_path, models_dir, data_fingerprint)
+    predictors = data["predictors"]
+    scale_features = data["scale_features"]
+    leave_unscaled = data["leave_unscaled"]
+    X_train, X_test, y_train, y_test = data["X_train"], data["X_test"], data["y_train"], data["y_test"]
+
+    fits_started = time.perf_counter()
+    trained = run_model_jobs(
+        stale, X_train, y_train, X_test, y_test, models_dir,
+        workers=workers, total_cores=total_cores, tuning=tuning
     )
+    fits_seconds = time.perf_counter() - fits_started
 
     # Save scaler and model info
-    scaler = StandardScaler()
-    scaler.fit(df[scale_features])
-
     scaler_path = models_dir / "scaler.pkl"
     with open(scaler_path, "wb") as f:
-        pickle.dump(scaler, f)
+        pickle.dump(data["scaler"], f)
     logger.info(f"💾 Scaler saved to {scaler_path}")
 
+    # Models not retrained in this run keep their recorded metrics
+    previous_info = {}
+    if model_info_path.exists() and len(stale) < len(MODEL_SPECS):
+        with open(model_info_path, "rb") as f:
+            previous_info = pickle.load(f)
+    model_performance = dict(previous_info.get("model_performance", {}))
+    model_metrics = dict(previous_info.get("model_metrics", {}))
+    for key, result in trained.items():
+        model_performance[key] = result["metrics"]["accuracy"]
+        model_metrics[MODEL_SPECS[key]["artifact"]] = result["metrics"]
+
     # Save model info
     model_info = {
         "predictors": predictors,
         "scale_features": scale_features,
         "leave_unscaled": leave_unscaled,
-        "model_performance": {
-            "logistic_regression": accuracy,
-            "decision_tree": accuracy_dt,
-            "random_forest": accuracy_rf,
-            "xgboost": accuracy_xgb,
-        },
+        "model_performance": model_performance,
+        "model_metrics": model_metrics,
+        # Best hyperparameters and CV scores from the last tuning run, by artifact
+        "tuning": tuning,
     }
 
-    model_info_path = models_dir / "model_info.pkl"
     with open(model_info_path, "wb") as f:
         pickle.dump(model_info, f)
     logger.info(f"💾 Model info saved to {model_info_path}")
 
+    # Manifest with checksums, sizes, feature lists and metrics for the registry
+    manifest_path = write_manifest(
+        models_dir,
+        model_info,
+        model_metrics,
+        {spec["artifact"]: list(X_train.columns) for spec in MODEL_SPECS.values()},
+        tuning,
+    )
+
+    # Recorded last, so an interrupted run retrains instead of trusting half-written artifacts
+    for key in trained:
+        fingerprints["models"][MODEL_SPECS[key]["artifact"]] = {
+            "fingerprint": model_fingerprint(key, data_fingerprint, tuning),
+            "data_fingerprint": data_fingerprint,
+            "config": model_config(key, tuning),
+            "trained_at": datetime.now().isoformat(),
+        }
+    fingerprints_path = save_fingerprints(models_dir, fingerprints)
+
     # Summary
     logger.info("\n" + "=" * 50)
     logger.info("🎉 TRAINING COMPLETE!")
     logger.info("=" * 50)
     logger.info("📁 Saved files:")
     logger.info(f"   - {scaler_path}")
-    logger.info(f"   - {logit_path}")
-    logger.info(f"   - {dt_path}")
-    logger.info(f"   - {rf_path}")
-    logger.info(f"   - {xgb_path}")
+    for result in trained.values():
+        logger.info(f"   - {result['path']}")
     logger.info(f"   - {model_info_path}")
+    logger.info(f"   - {manifest_path}")
+    logger.info(f"   - {fingerprints_path}")
 
     logger.info("\n📊 Model Performance Summary:")
-    logger.info(f"   - Logistic Regression: {accuracy:.4f}")
-    logger.info(f"   - Decision Tree: {accuracy_dt:.4f}")
-    logger.info(f"   - Random Forest: {accuracy_rf:.4f}")
-    logger.info(f"   - XGBoost: {accuracy_xgb:.4f}")
+    for key, result in trained.items():
+        logger.info(
+            f"   - {MODEL_SPECS[key]['label']}: {result['metrics']['accuracy']:.4f} "
+            f"({result['seconds']:.1f}s on {result['n_jobs']} cores)"
+        )
+    logger.info(f"⏱️ Model fits took {fits_seconds:.1f}s wall clock")
 
     return model_info
 
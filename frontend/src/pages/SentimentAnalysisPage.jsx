@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { Search, TrendingUp, TrendingDown, AlertTriangle, CheckCircle, Globe } from 'lucide-react';
-import { analyzeSentiment } from '../services/api';
+import { streamSentiment } from '../services/api';
 import FadeContent from '../components/ui/FadeContent';
 import AnimatedContent from '../components/ui/AnimatedContent';
 import GlassPanel from '../components/ui/GlassPanel';
@@ -9,25 +9,34 @@ export default function SentimentAnalysisPage() {
   const [companyName, setCompanyName] = useState('');
   const [loading, setLoading] = useState(false);
   const [results, setResults] = useState(null);
+  const [sources, setSources] = useState(null);
   const [error, setError] = useState(null);
 
-  const handleAnalysis = async (e) => {
+  const handleAnalysis = (e) => {
     e.preventDefault();
     if (!companyName.trim()) return;
 
     setLoading(true);
     setError(null);
+    setResults(null);
+    setSources(null);
 
-    try {
-      const data = await analyzeSentiment(companyName);
-      setResults(data);
-    } catch (err) {
-      setError(err.response?.data?.detail || 'Failed to analyze sentiment');
-    } finally {
-      setLoading(false);
-    }
+    // Web sources render as soon as the search returns; the score follows
+    streamSentiment(companyName, {
+      onSources: setSources,
+      onResult: (data) => {
+        setResults(data);
+        setLoading(false);
+      },
+      onError: (detail) => {
+        setError(detail);
+        setLoading(false);
+      },
+    });
   };
 
+  const webSources = results?.web_sources || sources;
+
   const getRiskIcon = (riskLevel) => {
     switch (riskLevel) {
       case 'low':
@@ -149,29 +158,31 @@ export default function SentimentAnalysisPage() {
         </div>
 
         {/* Results */}
-        {results && (
+        {webSources && (
           <div className="mt-12 space-y-6">
             {/* Contributing Factors */}
-            <AnimatedContent distance={20} direction="up" delay={150}>
-              <GlassPanel className="p-8">
-                <h2 className="text-xl font-medium text-gray-100 mb-6">Contributing Factors</h2>
-                <div className="space-y-3">
-                  {results.contributing_factors.map((factor, index) => (
-                    <div key={index} className="flex items-start space-x-3">
-                      <div className="w-1.5 h-1.5 rounded-full bg-violet-400 mt-2 flex-shrink-0" />
-                      <p className="text-gray-400 text-sm">{factor}</p>
-                    </div>
-                  ))}
-                </div>
-              </GlassPanel>
-            </AnimatedContent>
+            {results && (
+              <AnimatedContent distance={20} direction="up" delay={150}>
+                <GlassPanel className="p-8">
+                  <h2 className="text-xl font-medium text-gray-100 mb-6">Contributing Factors</h2>
+                  <div className="space-y-3">
+                    {results.contributing_factors.map((factor, index) => (
+                      <div key={index} className="flex items-start space-x-3">
+                        <div className="w-1.5 h-1.5 rounded-full bg-violet-400 mt-2 flex-shrink-0" />
+                        <p className="text-gray-400 text-sm">{factor}</p>
+                      </div>
+                    ))}
+                  </div>
+                </GlassPanel>
+              </AnimatedContent>
+            )}
 
             {/* Web Sources */}
             <AnimatedContent distance={20} direction="up" delay={200}>
               <GlassPanel className="p-8">
                 <h2 className="text-xl font-medium text-gray-100 mb-6">Web Sources</h2>
                 <div className="space-y-4">
-                  {results.web_sources.map((source, index) => (
+                  {webSources.map((source, index) => (
                     <GlassPanel key={index} darker className="p-4 hover:bg-white/[0.03] transition-all duration-200">
                       <div className="flex items-start space-x-3">
                         <Globe className="text-gray-600 mt-1 flex-shrink-0" size={14} />
@@ -81,6 +81,28 @@ export const analyzeSentiment = async (companyName) => {
   return response.data;
 };
 
+// Stream sentiment analysis over server-sent events: sources arrive first,
+// then analysis deltas, then the full result
+export const streamSentiment = (companyName, { onSources, onDelta, onResult, onError } = {}) => {
+  const url = `${API_BASE_URL}/api/sentiment-analysis/stream?company_name=${encodeURIComponent(companyName)}`;
+  const source = new EventSource(url);
+
+  source.addEventListener('sources', (event) => onSources?.(JSON.parse(event.data)));
+  source.addEventListener('analysis', (event) => onDelta?.(JSON.parse(event.data).delta));
+  source.addEventListener('result', (event) => {
+    source.close();
+    onResult?.(JSON.parse(event.data));
+  });
+  source.addEventListener('error', (event) => {
+    source.close();
+    const detail = event.data ? JSON.parse(event.data).detail : 'Failed to analyze sentiment';
+    onError?.(detail);
+  });
+
+  // Returned so callers can abort the stream
+  return () => source.close();
+};
+
 // Get available models
 export const getModels = async () => {
   try {